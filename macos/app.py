@@ -3,17 +3,27 @@ import rumps
 import pyperclip
 import json
 import os
-import re
-from llm_service import get_llm_service
+import sys
+import threading
 from functools import partial
 
+# The shared engine lives next to this folder (bundled as a package by py2app)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from supercopy_core.menu_model import MenuModel, build_menu_model
+from supercopy_core.pipeline import Pipeline, create_llm_service
+from supercopy_core.profiling import profiled, start_from_env, toggle_profiling, is_profiling, debug_menu_enabled
+
 class LlmCopyPasteApp(rumps.App):
     def __init__(self):
         super(LlmCopyPasteApp, self).__init__("📋")
         self.config_file = os.path.expanduser("~/.supercopy_config.json")
-        self.llm_service = None
-        self.last_clipboard_content = ""
+        self.pipeline = None
         self.is_paused = False  # Track pause state
+        # The pipeline reports from its worker thread; menus are applied on the main thread
+        self.pending_menu_update = None
+        self.pending_status = None
+        self.update_lock = threading.Lock()
 
         # Load API key and initialize service
         self.load_config()
@@ -23,7 +33,7 @@ class LlmCopyPasteApp(rumps.App):
             self.initialize_llm_service()
 
         # Initialize menu properly
-        self.update_menu({"info": "Copy some text to start..."} if self.llm_service else {"error": "Please configure API key in Settings"})
+        self.update_menu(self.idle_menu())
 
         # Run first check on startup
         self.check_clipboard(None)
@@ -53,11 +63,26 @@ class LlmCopyPasteApp(rumps.App):
     def initialize_llm_service(self):
         """Initialize the LLM service with the API key"""
         try:
-            from llm_service import GeminiService
-            self.llm_service = GeminiService(self.api_key)
+            service = create_llm_service(self.api_key)
         except Exception as e:
             print(f"Error initializing LLM service: {e}")
-            self.llm_service = None
+            self.pipeline = None
+            return
+        if self.pipeline is not None:
+            self.pipeline.set_service(service)
+            return
+        self.pipeline = Pipeline(
+            service,
+            read_clipboard=pyperclip.paste,
+            write_clipboard=pyperclip.copy,
+            on_menu=self.queue_menu_update,
+            on_status=self.queue_status,
+        )
+
+    def idle_menu(self):
+        if self.pipeline:
+            return build_menu_model({"info": "Copy some text to start..."})
+        return build_menu_model({"error": "Please configure API key in Settings"})
 
     def show_settings_dialog(self, _):
         """Show a dialog to enter API key"""
@@ -81,34 +106,31 @@ class LlmCopyPasteApp(rumps.App):
             if not hasattr(self, 'api_key') or not self.api_key:
                 rumps.notification("Warning", "SuperCopy needs an API key to function.", "")
 
-    def detect_secrets(self, text):
-        """Detect if text contains sensitive information like passwords"""
-        # Simple rule: if it's a single string with no spaces and under 30 characters,
-        # it's likely a password or sensitive token
-        text = text.strip()
-
-        # Check if it's a single string with no spaces and under 30 characters
-        if len(text) < 30 and ' ' not in text and len(text) > 0:
-            return True
-
-        return False
-
     @rumps.timer(1)
+    @profiled
     def check_clipboard(self, _):
-        if self.is_paused:
+        if self.is_paused or not self.pipeline:
             return
-
-        current_clipboard = pyperclip.paste()
-        if current_clipboard is None:
-            current_clipboard = ""
-        else:
-            current_clipboard = current_clipboard.strip()
-
-        # Process only if clipboard is not empty and has new content
-        if current_clipboard and current_clipboard != self.last_clipboard_content:
-            self.title = "✨"  # Indicate processing
-            self.last_clipboard_content = current_clipboard
-            self.process_text(current_clipboard)
+        self.pipeline.poll()
+
+    def queue_menu_update(self, menu, done):
+        with self.update_lock:
+            self.pending_menu_update = menu
+
+    def queue_status(self, status):
+        with self.update_lock:
+            self.pending_status = status
+
+    @rumps.timer(0.25)
+    def apply_pending_menu_update(self, _):
+        """Apply menus and status from the pipeline on the main thread"""
+        with self.update_lock:
+            menu, self.pending_menu_update = self.pending_menu_update, None
+            status, self.pending_status = self.pending_status, None
+        if menu is not None:
+            self.update_menu(menu)
+        if status and not self.is_paused:
+            self.title = "✨" if status == "processing" else "📋"
 
     def toggle_pause(self, _):
         """Toggle pause/resume state for clipboard monitoring"""
@@ -122,109 +144,76 @@ class LlmCopyPasteApp(rumps.App):
             rumps.notification("SuperCopy Resumed", "Clipboard monitoring is now active", "")
 
         # Update menu to reflect new state
-        if hasattr(self, 'last_menu_data'):
-            self.update_menu(self.last_menu_data)
-        else:
-            self.update_menu({"info": "Copy some text to start..."} if self.llm_service else {"error": "Please configure API key in Settings"})
+        self.update_menu(getattr(self, 'last_menu', None) or self.idle_menu())
 
-    def process_text(self, text):
-        if not self.llm_service:
-            self.update_menu({"error": "LLM service not initialized. Please check settings."})
-            return
-
-        # Check for secrets before sending to LLM
-        if self.detect_secrets(text):
-            self.update_menu({"warning": "Secrets detected: Skipping analysis"})
-            self.title = "📋"  # Reset icon
-            return
-
-        extracted_data = self.llm_service.analyze_text(text)
-        self.update_menu(extracted_data)
-        self.title = "📋"  # Reset icon
-
-    def update_menu(self, data: dict):
+    @profiled
+    def update_menu(self, model: MenuModel):
         self.menu.clear()
-        self.last_menu_data = data  # Store for refresh when toggling pause
+        self.last_menu = model  # Store for refresh when toggling pause
 
         # Add pause/resume button at the top
         pause_text = "Resume Monitoring" if self.is_paused else "Pause Monitoring"
         self.menu.add(rumps.MenuItem(pause_text, callback=self.toggle_pause))
         self.menu.add(rumps.separator)
 
-        if not data or "error" in data:
-            self.menu.add(f"Error: {data.get('error', 'Unknown')}")
+        if model.kind in ("empty", "error"):
+            self.menu.add(f"Error: {model.message or 'Unknown'}")
             self.menu.add(rumps.MenuItem("Copy some text to start..."))
             # Add settings menu even on error
             self.menu.add(rumps.separator)
+            self.add_profiling_item()
             self.menu.add(rumps.MenuItem("Settings", callback=self.show_settings_dialog))
             self.menu.add(rumps.separator)
             self.menu.add(rumps.MenuItem("Quit", callback=self.quit_app))
             return
 
-        if "warning" in data:
-            self.menu.add(data.get('warning', 'Warning'))
+        if model.kind == "warning":
+            self.menu.add(model.message)
             self.menu.add(rumps.separator)
-            self.menu.add(rumps.MenuItem(f"Original: {self.last_clipboard_content[:30]}...", callback=partial(self.copy_to_clipboard, self.last_clipboard_content)))
+            self.menu.add(rumps.MenuItem(model.original_label, callback=partial(self.copy_to_clipboard, model.original, model.original)))
             self.menu.add(rumps.separator)
+            self.add_profiling_item()
             self.menu.add(rumps.MenuItem("Settings", callback=self.show_settings_dialog))
             self.menu.add(rumps.MenuItem("Quit", callback=self.quit_app))
             return
 
-        if "info" in data:
-            self.menu.add(data.get('info', 'Ready...'))
+        if model.kind == "info":
+            self.menu.add(model.message)
             self.menu.add(rumps.separator)
+            self.add_profiling_item()
             self.menu.add(rumps.MenuItem("Settings", callback=self.show_settings_dialog))
             self.menu.add(rumps.separator)
             self.menu.add(rumps.MenuItem("Quit", callback=self.quit_app))
             return
 
-        # Dynamically create menu items for each key in the data
-        for key, value in data.items():
-            if key == "error":  # Skip error key if present
-                continue
-
-            if not value:  # Skip empty values (empty lists, empty strings, None, etc.)
-                continue
-
-            if isinstance(value, list):
-                if len(value) > 0:
-                    # For lists, join items and show preview + count
-                    all_items = ", ".join(str(item) for item in value)
-                    preview = all_items[:30] + "..." if len(all_items) > 30 else all_items
-                    menu_label = f"Paste All {key.replace('_', ' ').title()} ({len(value)}): {preview}"
-                    menu_item = rumps.MenuItem(
-                        menu_label,
-                        callback=partial(self.copy_to_clipboard, all_items)
-                    )
-                    self.menu.add(menu_item)
-            elif isinstance(value, str):
-                # For strings, show truncated preview
-                preview = value[:30] + "..." if len(value) > 30 else value
-                menu_label = f"Paste {key.replace('_', ' ').title()}: {preview}"
-                menu_item = rumps.MenuItem(
-                    menu_label,
-                    callback=partial(self.copy_to_clipboard, value)
-                )
-                self.menu.add(menu_item)
-            else:
-                # For other types, convert to string and show preview
-                value_str = str(value)
-                preview = value_str[:30] + "..." if len(value_str) > 30 else value_str
-                menu_label = f"Paste {key.replace('_', ' ').title()}: {preview}"
-                menu_item = rumps.MenuItem(
-                    menu_label,
-                    callback=partial(self.copy_to_clipboard, value_str)
-                )
-                self.menu.add(menu_item)
+        # One menu item per pasteable entry
+        for entry in model.entries:
+            self.menu.add(rumps.MenuItem(entry.label, callback=partial(self.copy_to_clipboard, entry.value, model.original)))
 
         self.menu.add(rumps.separator)
-        self.menu.add(rumps.MenuItem(f"Original: {self.last_clipboard_content[:30]}...", callback=partial(self.copy_to_clipboard, self.last_clipboard_content)))
+        self.menu.add(rumps.MenuItem(model.original_label, callback=partial(self.copy_to_clipboard, model.original, model.original)))
         self.menu.add(rumps.separator)
+        self.add_profiling_item()
         self.menu.add(rumps.MenuItem("Settings", callback=self.show_settings_dialog))
         self.menu.add(rumps.MenuItem("Quit", callback=self.quit_app))
 
-    def copy_to_clipboard(self, content: str, _):
-        pyperclip.copy(content)
+    def add_profiling_item(self):
+        """Hidden unless SUPERCOPY_DEBUG_MENU is set or profiling is running"""
+        if debug_menu_enabled():
+            title = "Stop Profiling" if is_profiling() else "Start Profiling"
+            self.menu.add(rumps.MenuItem(title, callback=self.toggle_profiling))
+
+    def toggle_profiling(self, _):
+        out_dir = toggle_profiling()
+        if not is_profiling():
+            rumps.notification("Profiling Stopped", "Profile written to:", out_dir or "")
+        self.update_menu(self.last_menu)
+
+    def copy_to_clipboard(self, content: str, parent: str, _):
+        if self.pipeline:
+            self.pipeline.copy(content, parent)  # Not re-analyzed on the next poll
+        else:
+            pyperclip.copy(content)
         rumps.notification("Copied!", "Content is now on your clipboard.", "")
 
     def quit_app(self, _):
@@ -232,5 +221,6 @@ class LlmCopyPasteApp(rumps.App):
 
 
 if __name__ == "__main__":
+    start_from_env()  # SUPERCOPY_PROFILE=1
     app = LlmCopyPasteApp()
     app.run()
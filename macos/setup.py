@@ -3,8 +3,13 @@
 Setup script for SuperCopy macOS app.
 To build: python3 setup.py py2app
 """
+import os
+import sys
 from setuptools import setup
 
+# The shared supercopy_core package lives at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 APP = ['app.py']
 
 # Include splash screen in the app's Resources folder
@@ -12,7 +17,8 @@ DATA_FILES = [('resources', ['splash.png'])]
 
 OPTIONS = {
     'argv_emulation': False,
-    'includes': ['llm_service', 'jaraco'],
+    'packages': ['supercopy_core'],
+    'includes': ['jaraco'],
     'excludes': ['tkinter', 'wheel'], # <-- ADD 'wheel' HERE
     'iconfile': 'icon.icns',
     'plist': {
@@ -0,0 +1,5 @@
+# supercopy_core
+"""
+The platform-neutral SuperCopy engine shared by the macOS and Windows apps:
+LLM services, caching, the clipboard-to-menu pipeline and its tooling.
+"""
@@ -0,0 +1,217 @@
+# clip_cache.py
+import hashlib
+import re
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+
+from .model_policy import looks_like_code
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_HSPACE_RE = re.compile(r"[ \t\f\v]+")
+_INDENT_RE = re.compile(r"[ \t]*")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_INDENTED_LINE_RE = re.compile(r"^[ \t]+\S", re.MULTILINE)
+
+
+def canonicalize(text: str) -> str:
+    """
+    Normalizes text so that cosmetic re-copies compare equal.
+    Line endings, trailing spaces, runs of horizontal whitespace within a
+    line, indentation shared by every line and surrounding blank lines are
+    folded away. Relative indentation is kept, since in code and YAML it
+    changes the meaning.
+    """
+    if not text:
+        return ""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = []
+    for line in text.split("\n"):
+        indent = _INDENT_RE.match(line).group(0)
+        body = _HSPACE_RE.sub(" ", line[len(indent):]).rstrip()
+        lines.append(indent + body if body else "")
+    text = textwrap.dedent("\n".join(lines))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip("\n")
+
+
+def is_structured(canonical: str) -> bool:
+    """
+    True for code and indentation-structured text (YAML, outlines). Word
+    shingles can't see indentation, so such clips only ever match exactly.
+    """
+    return looks_like_code(canonical) or bool(_INDENTED_LINE_RE.search(canonical))
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shingle(tokens, size=3):
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def tokenize(canonical: str):
+    return _WORD_RE.findall(canonical.lower())
+
+
+def simhash(shingles) -> int:
+    """Computes a 64-bit SimHash fingerprint over a set of shingles."""
+    weights = [0] * 64
+    for item in shingles:
+        h = _hash64(item)
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fingerprint = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "shingles", "result", "stored_at")
+
+    def __init__(self, fingerprint, shingles, result):
+        self.fingerprint = fingerprint
+        self.shingles = shingles
+        self.result = result
+        self.stored_at = time.time()
+
+
+class NearDuplicateCache:
+    """
+    An LRU cache of recent analyses keyed by canonicalized text, with a
+    SimHash index so that almost-identical clips can reuse a previous result.
+
+    A lookup first tries an exact match on the canonical text. Failing that,
+    entries whose fingerprint is within `max_distance` bits are verified with
+    the Jaccard similarity of their word shingles against `similarity`.
+    Clips shorter than `min_tokens` words only ever match exactly, since a
+    single edited word in a phone number or name changes the whole answer;
+    so do code and indented text (see `is_structured`).
+    """
+
+    def __init__(self, capacity=64, similarity=0.85, max_distance=6, min_tokens=8):
+        self.capacity = capacity
+        self.similarity = similarity
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(canonical: str) -> str:
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _features(self, canonical: str):
+        tokens = tokenize(canonical)
+        if len(tokens) < self.min_tokens or is_structured(canonical):
+            return None, None
+        shingles = shingle(tokens)
+        return simhash(shingles), shingles
+
+    def lookup(self, text: str):
+        """
+        Returns a (result, exact) tuple for a cached analysis of `text`,
+        or None if nothing close enough has been seen.
+        """
+        canonical = canonicalize(text)
+        key = self._key(canonical)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry.result, True
+
+        fingerprint, shingles = self._features(canonical)
+        if fingerprint is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            best_key, best_score = None, 0.0
+            for other_key, entry in self._entries.items():
+                if entry.fingerprint is None:
+                    continue
+                if hamming_distance(fingerprint, entry.fingerprint) > self.max_distance:
+                    continue
+                union = len(shingles | entry.shingles)
+                score = len(shingles & entry.shingles) / union if union else 0.0
+                if score >= self.similarity and score > best_score:
+                    best_key, best_score = other_key, score
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.stats["near_hits"] += 1
+            return self._entries[best_key].result, False
+
+    def store(self, text: str, result: dict):
+        canonical = canonicalize(text)
+        fingerprint, shingles = self._features(canonical)
+        with self._lock:
+            self._entries[self._key(canonical)] = _Entry(fingerprint, shingles, result)
+            self._entries.move_to_end(self._key(canonical))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        hits = self.stats["exact_hits"] + self.stats["near_hits"]
+        return hits / total if total else 0.0
+
+
+if __name__ == "__main__":
+    # Replays a small synthetic clipboard trace and reports how often a cached
+    # analysis was reused, and how often it was reused for the wrong content.
+    article = ("The study, conducted by researchers at the university, found that daily "
+               "exercise significantly improves mood and sleep quality in adults over forty. "
+               "The lead author, Dr. Reed, can be reached at ereed@email.com for comments.")
+    meeting = ("Alex: Can you send the quarterly report by Friday? Sarah: Yes, I will get "
+               "it done before the review. Mark: Great. Also, we decided to move the launch "
+               "to the 15th so marketing has time to prepare.")
+    # Each trace item is (clip, intent); reusing a result across intents is a false reuse.
+    trace = [
+        (article, "article"),
+        (article + "\n", "article"),
+        (article.replace(" ", "  "), "article"),
+        (article.replace(". ", ".\r\n"), "article"),
+        (article.replace("significantly", "substantially"), "article"),
+        (meeting, "meeting"),
+        ("  " + meeting + "  ", "meeting"),
+        (meeting.replace("Friday", "Monday"), "meeting-monday"),
+        ("Call me at 555-867-5309", "phone-a"),
+        ("Call me at 555-867-5310", "phone-b"),
+        ("Call me at 555-867-5309\n", "phone-a"),
+        (article.split(".")[0] + ".", "article-first-sentence"),
+        ("if ready:\n    if retries > 3:\n        alert(owner)\n    reset(counter)\n", "code-reset-always"),
+        ("if ready:\n    if retries > 3:\n        alert(owner)\n        reset(counter)\n", "code-reset-on-alert"),
+        ("    if ready:\n        if retries > 3:\n            alert(owner)\n        reset(counter)\n", "code-reset-always"),
+    ]
+
+    cache = NearDuplicateCache()
+    reused = false_reuse = 0
+    for clip, intent in trace:
+        hit = cache.lookup(clip)
+        if hit is None:
+            cache.store(clip, {"intent": intent})
+            continue
+        result, exact = hit
+        reused += 1
+        if result["intent"] != intent:
+            false_reuse += 1
+            print(f"False reuse ({'exact' if exact else 'near'}): {intent} served {result['intent']}")
+
+    print(f"Clips: {len(trace)}  Reused: {reused}  Hit rate: {cache.hit_rate():.0%}  "
+          f"False reuse: {false_reuse} ({false_reuse / reused if reused else 0:.0%} of reuses)")
+    print(f"Stats: {cache.stats}")
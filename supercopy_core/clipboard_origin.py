@@ -0,0 +1,106 @@
+# clipboard_origin.py
+"""
+Tells SuperCopy's own clipboard writes apart from the user's copies.
+
+Picking a menu item puts SuperCopy's output on the clipboard, and the next
+poll would otherwise analyze that output and replace the menu the user was
+still using. Every write is recorded by content hash, along with the
+clipboard's sequence number where the platform has one (Windows
+GetClipboardSequenceNumber, macOS NSPasteboard changeCount). A clip matches a
+recorded write only while the sequence number is unchanged, so the same text
+copied later by another app is still analyzed. Without sequence numbers a
+write matches for `ttl` seconds.
+
+A write is recorded before the clipboard is touched and its sequence number
+filled in afterwards (`record_write`, then `mark_written`), so a poll on
+another thread that lands in between still recognizes it.
+"""
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def _sequence_reader():
+    """Returns a function reading the clipboard sequence number, or None."""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            return ctypes.windll.user32.GetClipboardSequenceNumber
+        except Exception:
+            return None
+    if sys.platform == "darwin":
+        try:
+            from AppKit import NSPasteboard  # Installed with rumps (pyobjc)
+            return lambda: NSPasteboard.generalPasteboard().changeCount()
+        except Exception:
+            return None
+    return None
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ClipboardOrigin:
+    """Remembers recent self-initiated clipboard writes."""
+
+    def __init__(self, capacity=16, ttl=30.0, sequence_number="auto"):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.sequence_number = _sequence_reader() if sequence_number == "auto" else sequence_number
+        self._writes = OrderedDict()  # digest -> [written_at, sequence, parent_text]
+        self._lock = threading.Lock()
+        self.stats = {"writes": 0, "skipped": 0, "calls_avoided": 0}
+
+    def _sequence(self):
+        if self.sequence_number is None:
+            return None
+        try:
+            return self.sequence_number()
+        except Exception:
+            return None
+
+    def record_write(self, text: str, parent: str = ""):
+        """Call just before writing text to the clipboard. parent is the clip it came from."""
+        entry = [time.monotonic(), None, parent]
+        with self._lock:
+            key = _digest(text)
+            self._writes[key] = entry
+            self._writes.move_to_end(key)
+            while len(self._writes) > self.capacity:
+                self._writes.popitem(last=False)
+            self.stats["writes"] += 1
+
+    def mark_written(self, text: str):
+        """Call once the write is done, to pin the record to the new sequence number."""
+        sequence = self._sequence()
+        with self._lock:
+            entry = self._writes.get(_digest(text))
+            if entry is not None:
+                entry[0], entry[1] = time.monotonic(), sequence
+
+    def forget(self, text: str):
+        """Drops the record of a write that failed."""
+        with self._lock:
+            self._writes.pop(_digest(text), None)
+
+    def is_own_write(self, text: str) -> bool:
+        """True (once) if text is on the clipboard because SuperCopy put it there."""
+        with self._lock:
+            entry = self._writes.pop(_digest(text), None)
+        if entry is None:
+            return False
+        written_at, sequence, parent = entry
+        if sequence is not None:
+            if self._sequence() != sequence:
+                return False  # Someone else has written since, even if the text is the same
+        elif time.monotonic() - written_at > self.ttl:  # No sequence number (yet)
+            return False
+        with self._lock:
+            self.stats["skipped"] += 1
+            # Re-copying the original would have been a cache hit; anything else was an LLM call
+            if text != parent:
+                self.stats["calls_avoided"] += 1
+        return True
@@ -0,0 +1,637 @@
+# engine_daemon.py
+"""
+A headless SuperCopy engine that several front ends can share.
+
+The daemon owns one LLM service (and so one HTTP connection pool, one
+near-duplicate cache and one quota budget) and serves it over a local socket.
+See ENGINE_PROTOCOL.md in the repository root for the wire protocol.
+
+By default the engine listens on a Unix socket inside ~/.supercopy (a 0700
+directory) on macOS and Linux, and on 127.0.0.1:47800 on Windows. TCP
+connections must authenticate with the token the daemon writes to
+~/.supercopy/engine.token (mode 0600), and the daemon proves it knows the same
+token before a client sends it any text.
+
+Usage:
+    python -m supercopy_core.engine_daemon serve [--address 127.0.0.1:47800 | --address unix:/path/to/engine.sock]
+    python -m supercopy_core.engine_daemon analyze "some text" ["more text" ...]
+    python -m supercopy_core.engine_daemon stats
+    python -m supercopy_core.engine_daemon loadtest [--clients 32] [--requests 10] [--latency 0.2]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import os
+import secrets
+import socket
+import socketserver
+import statistics
+import sys
+import threading
+import time
+
+from .clip_cache import canonicalize
+from .fanout_service import FanOutService, fanout_enabled
+from .llm_service import LLMService, GeminiService, CachedLLMService, FakeLLMService
+
+CONFIG_FILE = os.path.expanduser("~/.supercopy_config.json")
+ENGINE_DIR = os.path.expanduser("~/.supercopy")
+TOKEN_FILE = os.path.join(ENGINE_DIR, "engine.token")
+PROTOCOL_VERSION = 2
+# Seconds a RemoteLLMService waits before trying an unreachable engine again
+RECONNECT_INTERVAL = 30.0
+# Seconds to wait for the next event; analyses can queue behind the quota limiter
+READ_TIMEOUT = 120.0
+
+
+def default_address() -> str:
+    if os.getenv("SUPERCOPY_ENGINE"):
+        return os.getenv("SUPERCOPY_ENGINE")
+    if sys.platform != "win32" and hasattr(socket, "AF_UNIX"):
+        return "unix:" + os.path.join(ENGINE_DIR, "engine.sock")
+    return "127.0.0.1:47800"
+
+
+DEFAULT_ADDRESS = default_address()
+
+
+def parse_address(address: str):
+    """Returns (family, address) for "host:port" or "unix:/path" strings."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def load_api_key() -> str:
+    try:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as f:
+                return json.load(f).get("gemini_api_key", "")
+    except Exception as e:
+        print(f"Error loading config: {e}")
+    return ""
+
+
+# --- Authentication ---
+def _private_dir():
+    """Creates ~/.supercopy readable by the current user only."""
+    os.makedirs(ENGINE_DIR, mode=0o700, exist_ok=True)
+    os.chmod(ENGINE_DIR, 0o700)
+
+
+def write_token() -> str:
+    """Writes a fresh random token for TCP clients and returns it."""
+    _private_dir()
+    token = secrets.token_hex(32)
+    fd = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    os.chmod(TOKEN_FILE, 0o600)
+    return token
+
+
+def read_token():
+    try:
+        with open(TOKEN_FILE, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _proof(token: str, role: str, nonce: str) -> str:
+    # The role keeps a client from replaying the server's proof back to it
+    return hmac.new(token.encode("utf-8"), f"{role}:{nonce}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+# --- Engine ---
+class UpstreamQuota:
+    """
+    Limits upstream requests both in concurrency and in requests per minute.
+    It is held around each HTTP request (see GeminiService.limiter), so fan-out
+    categories, batch packs and retries are each charged.
+    """
+
+    def __init__(self, max_concurrent: int = 4, requests_per_minute: int = 60):
+        self._upstream = threading.BoundedSemaphore(max_concurrent)
+        self._interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._slot_lock = threading.Lock()
+        self.calls = 0
+
+    def _wait_for_quota(self):
+        # Spreads upstream calls at least `_interval` apart
+        with self._slot_lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+            self.calls += 1
+        if wait > 0:
+            time.sleep(wait)
+
+    def __enter__(self):
+        self._upstream.acquire()
+        try:
+            self._wait_for_quota()
+        except BaseException:
+            self._upstream.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self._upstream.release()
+        return False
+
+
+def _upstream_service(service: LLMService):
+    """Finds the service that makes the HTTP requests, under any wrappers."""
+    while service is not None and not hasattr(service, "limiter"):
+        service = getattr(service, "service", None)
+    return service
+
+
+class Engine:
+    """
+    Shares one LLM service, cache and quota budget between all connected
+    clients. Identical requests that arrive while an analysis is already
+    running wait for that result instead of starting another one; cache hits
+    never wait behind the quota limiter.
+    """
+
+    def __init__(self, service: LLMService, max_concurrent: int = 4, requests_per_minute: int = 60):
+        upstream = _upstream_service(service)
+        if upstream is None:
+            raise ValueError("The engine's service has no upstream request hook to limit.")
+        self.quota = UpstreamQuota(max_concurrent, requests_per_minute)
+        upstream.limiter = self.quota
+        self.service = CachedLLMService(service)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def analyze(self, text: str, on_update=None) -> dict:
+        """
+        Analyzes text, calling on_update(menu_data, done) with partial results
+        as they arrive. Requests that join one already in flight only get the
+        final result.
+        """
+        self._count("requests")
+        key = canonicalize(text)
+        with self._inflight_lock:
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = {"done": threading.Event(), "result": None}
+                self._inflight[key] = pending
+        if not owner:
+            self._count("coalesced")
+            pending["done"].wait()
+            return pending["result"]
+
+        try:
+            pending["result"] = self.service.analyze_progressive(text, on_update or (lambda data, done: None))
+        except Exception as e:
+            self._count("errors")
+            pending["result"] = {"error": str(e)}
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            pending["done"].set()
+        return pending["result"]
+
+    def analyze_batch(self, texts: list) -> list:
+        self._count("requests")
+        try:
+            return self.service.analyze_batch(texts)
+        except Exception as e:
+            self._count("errors")
+            return [{"error": str(e)} for _ in texts]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            engine = dict(self.stats, upstream_calls=self.quota.calls)
+        stats = {"engine": engine}
+        stats.update(self.service.get_stats())
+        return stats
+
+
+# --- Server ---
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Events are small and sent back to back; don't let Nagle hold them
+        if self.connection.family == socket.AF_INET:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Per-connection challenge for the auth op
+        self.nonce = secrets.token_hex(16)
+        self.authenticated = self.server.token is None
+
+    def _send(self, message: dict):
+        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def _analyze(self, request_id, text: str):
+        sent = {}
+
+        def send_items(data):
+            if not isinstance(data, dict) or any(k in data for k in ("error", "warning", "info")):
+                return
+            for key, value in data.items():
+                if key not in sent or sent[key] != value:
+                    sent[key] = value
+                    self._send({"id": request_id, "event": "item", "key": key, "value": value})
+
+        self._send({"id": request_id, "event": "accepted"})
+        result = self.server.engine.analyze(text, lambda data, done: send_items(data))
+        send_items(result)  # Requests that joined another one only get the final result
+        self._send({"id": request_id, "event": "done", "data": result})
+
+    def handle(self):
+        engine = self.server.engine
+        token = self.server.token
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                self._send({"id": None, "event": "error", "error": "Malformed request."})
+                continue
+            request_id = request.get("id")
+            op = request.get("op")
+            try:
+                if op == "ping":
+                    reply = {"id": request_id, "event": "pong", "version": PROTOCOL_VERSION, "nonce": self.nonce}
+                    if token and isinstance(request.get("nonce"), str):
+                        reply["proof"] = _proof(token, "server", request["nonce"])
+                    self._send(reply)
+                elif op == "auth":
+                    if token and hmac.compare_digest(str(request.get("proof", "")), _proof(token, "client", self.nonce)):
+                        self.authenticated = True
+                    if self.authenticated:
+                        self._send({"id": request_id, "event": "authenticated"})
+                    else:
+                        self._send({"id": request_id, "event": "error", "error": "Authentication failed."})
+                elif not self.authenticated:
+                    self._send({"id": request_id, "event": "error", "error": "Not authenticated."})
+                elif op == "stats":
+                    self._send({"id": request_id, "event": "stats", "data": engine.get_stats()})
+                elif op == "analyze" and isinstance(request.get("text"), str):
+                    self._analyze(request_id, request["text"])
+                elif op == "analyze_batch" and isinstance(request.get("texts"), list):
+                    self._send({"id": request_id, "event": "accepted"})
+                    results = engine.analyze_batch([str(text) for text in request["texts"]])
+                    self._send({"id": request_id, "event": "done", "data": results})
+                else:
+                    self._send({"id": request_id, "event": "error", "error": f"Unknown or malformed op: {op}"})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def create_server(engine: Engine, address: str = DEFAULT_ADDRESS, token: str = None):
+    """
+    Creates the server. Unix sockets rely on their directory's permissions;
+    TCP servers should be given a token (see write_token) so only clients
+    that can read it are served.
+    """
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.dirname(addr) == ENGINE_DIR:
+            _private_dir()
+        if os.path.exists(addr):
+            os.unlink(addr)
+        server = _UnixServer(addr, _RequestHandler)
+    else:
+        server = _TCPServer(addr, _RequestHandler)
+    server.engine = engine
+    server.token = token
+    return server
+
+
+# --- Client ---
+class EngineClient:
+    """
+    A blocking client for the engine daemon; one connection per client.
+
+    Connecting also authenticates: over TCP the client needs the daemon's
+    token (read from TOKEN_FILE unless given) and refuses a daemon that can't
+    prove it has the same one. Any OSError leaves the connection unusable;
+    open a new client rather than retrying on this one.
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: float = READ_TIMEOUT, token: str = "auto"):
+        family, addr = parse_address(address)
+        if token == "auto":
+            token = read_token() if family != socket.AF_UNIX else None
+            if family != socket.AF_UNIX and token is None:
+                raise ConnectionError("No engine token; is the engine running?")
+        self.token = token
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(5.0)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self.sock.connect(addr)
+            self.sock.settimeout(timeout)
+            self._reader = self.sock.makefile("r", encoding="utf-8")
+            self._next_id = 0
+            self._lock = threading.Lock()
+            self._handshake()
+        except Exception:
+            self.sock.close()
+            raise
+
+    def _handshake(self):
+        nonce = secrets.token_hex(16)
+        pong = next(self._events(self._request("ping", nonce=nonce)))
+        if pong.get("event") != "pong":
+            raise ConnectionError("Not a SuperCopy engine.")
+        if self.token is None:
+            return
+        if not hmac.compare_digest(str(pong.get("proof", "")), _proof(self.token, "server", nonce)):
+            raise ConnectionError("Engine failed authentication.")
+        reply = next(self._events(self._request("auth", proof=_proof(self.token, "client", str(pong.get("nonce", ""))))))
+        if reply.get("event") != "authenticated":
+            raise ConnectionError(reply.get("error", "Engine rejected authentication."))
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+    def _request(self, op: str, **fields):
+        self._next_id += 1
+        request_id = str(self._next_id)
+        message = dict(fields, id=request_id, op=op)
+        self.sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        return request_id
+
+    def _events(self, request_id: str):
+        for line in self._reader:
+            event = json.loads(line)
+            if event.get("id") == request_id:
+                yield event
+        raise ConnectionError("Engine closed the connection.")
+
+    def analyze_stream(self, text: str):
+        """Yields protocol events for `text` up to and including "done" or "error"."""
+        with self._lock:
+            request_id = self._request("analyze", text=text)
+            for event in self._events(request_id):
+                yield event
+                if event["event"] in ("done", "error"):
+                    return
+
+    def analyze(self, text: str) -> dict:
+        for event in self.analyze_stream(text):
+            if event["event"] == "done":
+                return event["data"]
+            if event["event"] == "error":
+                return {"error": event["error"]}
+        return {"error": "No response from engine."}
+
+    def analyze_batch(self, texts: list) -> list:
+        with self._lock:
+            request_id = self._request("analyze_batch", texts=texts)
+            for event in self._events(request_id):
+                if event["event"] == "done":
+                    return event["data"]
+                if event["event"] == "error":
+                    return [{"error": event["error"]} for _ in texts]
+        return [{"error": "No response from engine."} for _ in texts]
+
+    def call(self, op: str) -> dict:
+        with self._lock:
+            request_id = self._request(op)
+            return next(self._events(request_id))
+
+
+class RemoteLLMService(LLMService):
+    """
+    An LLMService that forwards analysis to a running engine daemon.
+
+    A lost connection (daemon restart, read timeout) is reopened on the next
+    request. While the engine can't be reached, requests go to `fallback` (an
+    in-process service) if one is given, and the engine is tried again every
+    RECONNECT_INTERVAL seconds.
+    """
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, fallback: LLMService = None, client: EngineClient = None):
+        self.address = address
+        self.fallback = fallback
+        self.client = client
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self.client is None and time.monotonic() >= self._retry_at:
+                try:
+                    self.client = EngineClient(self.address)
+                except (OSError, ValueError) as e:
+                    print(f"Engine Error: {e}")
+                    self._retry_at = time.monotonic() + RECONNECT_INTERVAL
+            return self.client
+
+    def _drop(self, client: EngineClient):
+        with self._lock:
+            if self.client is client:
+                self.client = None
+        try:
+            client.close()
+        except OSError:
+            pass
+
+    def _call(self, request, fallback_request, error):
+        """Runs request(client), reconnecting once if the connection was lost."""
+        for _ in range(2):
+            client = self._connect()
+            if client is None:
+                break
+            try:
+                return request(client)
+            except (OSError, ValueError) as e:
+                print(f"Engine Error: {e}")
+                self._drop(client)
+                if isinstance(e, socket.timeout):
+                    break  # Don't queue the same request behind a stuck engine again
+        if self.fallback is not None:
+            return fallback_request()
+        return error
+
+    def analyze_text(self, text: str) -> dict:
+        return self._call(
+            lambda client: client.analyze(text),
+            lambda: self.fallback.analyze_text(text),
+            {"error": "Lost connection to SuperCopy engine."},
+        )
+
+    def analyze_progressive(self, text: str, on_update) -> dict:
+        def stream(client):
+            partial = {}
+            for event in client.analyze_stream(text):
+                if event["event"] == "item":
+                    partial[event["key"]] = event["value"]
+                    on_update(dict(partial), False)
+                elif event["event"] in ("done", "error"):
+                    result = event["data"] if event["event"] == "done" else {"error": event["error"]}
+                    on_update(result, True)
+                    return result
+            raise ConnectionError("No response from engine.")
+
+        result = self._call(stream, lambda: self.fallback.analyze_progressive(text, on_update), None)
+        if result is None:
+            result = {"error": "Lost connection to SuperCopy engine."}
+            on_update(result, True)
+        return result
+
+    def analyze_batch(self, texts: list) -> list:
+        return self._call(
+            lambda client: client.analyze_batch(texts),
+            lambda: self.fallback.analyze_batch(texts),
+            [{"error": "Lost connection to SuperCopy engine."} for _ in texts],
+        )
+
+
+def connect_engine(address: str = DEFAULT_ADDRESS, fallback: LLMService = None):
+    """
+    Returns a RemoteLLMService if an engine is listening (and authenticates)
+    at `address`, else None. `fallback` serves requests while it is down.
+    """
+    try:
+        return RemoteLLMService(address, fallback, client=EngineClient(address))
+    except (OSError, ValueError):
+        return None
+
+
+# --- Load Test ---
+def run_load_test(clients: int, requests_per_client: int, latency: float, distinct: int) -> dict:
+    """Runs many concurrent local clients against an in-process daemon backed by a fake LLM."""
+    fake = FakeLLMService(latency=latency)
+    engine = Engine(fake, max_concurrent=8, requests_per_minute=0)
+    token = secrets.token_hex(16)
+    server = create_server(engine, "127.0.0.1:0", token=token)
+    host, port = server.server_address
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker(index: int):
+        try:
+            client = EngineClient(f"{host}:{port}", token=token)
+            for n in range(requests_per_client):
+                text = f"Load test clip number {(index + n) % distinct} with enough words to look real."
+                started = time.monotonic()
+                result = client.analyze(text)
+                with lock:
+                    latencies.append(time.monotonic() - started)
+                    if "error" in result:
+                        failures.append(result["error"])
+            client.close()
+        except Exception as e:
+            with lock:
+                failures.append(str(e))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    server.shutdown()
+    server.server_close()
+
+    ordered = sorted(latencies)
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "failures": len(failures),
+        "upstream_calls": fake.calls,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 1) if ordered else 0.0,
+        "p95_ms": round(ordered[math.ceil(len(ordered) * 0.95) - 1] * 1000, 1) if ordered else 0.0,
+        "engine": engine.get_stats()["engine"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SuperCopy engine daemon")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Run the engine daemon")
+    serve.add_argument("--address", default=DEFAULT_ADDRESS)
+    serve.add_argument("--max-concurrent", type=int, default=4)
+    serve.add_argument("--rpm", type=int, default=60, help="Upstream requests per minute (0 = unlimited)")
+    analyze = sub.add_parser("analyze", help="Analyze text with a running daemon")
+    analyze.add_argument("text", nargs="+", help="More than one text is sent as a packed batch")
+    analyze.add_argument("--address", default=DEFAULT_ADDRESS)
+    stats = sub.add_parser("stats", help="Print stats from a running daemon")
+    stats.add_argument("--address", default=DEFAULT_ADDRESS)
+    load = sub.add_parser("loadtest", help="Load test an in-process daemon with a fake LLM")
+    load.add_argument("--clients", type=int, default=32)
+    load.add_argument("--requests", type=int, default=10)
+    load.add_argument("--latency", type=float, default=0.2)
+    load.add_argument("--distinct", type=int, default=8, help="Number of distinct clips in the workload")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        api_key = load_api_key() or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            print("API key is required. Configure it in SuperCopy Settings or set GEMINI_API_KEY.")
+            return 1
+        service = GeminiService(api_key)
+        if fanout_enabled():
+            service = FanOutService(service)  # Items then stream as each category finishes
+        token = None if parse_address(args.address)[0] == socket.AF_UNIX else write_token()
+        server = create_server(Engine(service, args.max_concurrent, args.rpm), args.address, token=token)
+        print(f"SuperCopy engine listening on {args.address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.command == "analyze" and len(args.text) > 1:
+        client = EngineClient(args.address)
+        for text, result in zip(args.text, client.analyze_batch(args.text)):
+            print(f"{text[:40]}: {json.dumps(result)}")
+        client.close()
+    elif args.command == "analyze":
+        client = EngineClient(args.address)
+        for event in client.analyze_stream(args.text[0]):
+            if event["event"] == "item":
+                print(f"{event['key']}: {event['value']}")
+            elif event["event"] == "error":
+                print(f"Error: {event['error']}")
+            elif event["event"] == "done" and any(k in event["data"] for k in ("error", "warning", "info")):
+                print(json.dumps(event["data"]))
+        client.close()
+    elif args.command == "stats":
+        client = EngineClient(args.address)
+        print(json.dumps(client.call("stats").get("data"), indent=2))
+        client.close()
+    elif args.command == "loadtest":
+        print(json.dumps(run_load_test(args.clients, args.requests, args.latency, args.distinct), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# fanout_service.py
+"""
+An alternative analysis mode that splits the single SuperCopy prompt into
+independent per-category requests (extraction, summary, transformation) run
+concurrently, so the cheapest menu items no longer wait for the slowest one.
+
+Enable it in the tray apps with SUPERCOPY_ANALYSIS_MODE=fanout.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .llm_service import LLMService, GeminiService
+from .prompt_normalizer import PLACEHOLDER_NOTE
+
+ANALYSIS_MODE_ENV = "SUPERCOPY_ANALYSIS_MODE"
+
+# Shared by every FanOutService in the process
+_POOL = ThreadPoolExecutor(max_workers=6, thread_name_prefix="supercopy-fanout")
+# Seconds between checks on categories still waiting for a pool worker
+_QUEUED_RECHECK = 0.05
+
+_HEADER = """You are the intelligent engine for "SuperCopy," a smart clipboard assistant. Analyze the user's clipboard text and return ONLY a single, valid, flat JSON object. Keys are concise, human-readable menu titles; values are the exact strings to paste. Omit any key that does not apply, and return {} if nothing applies. Do not add explanations or markdown.
+
+//-- Your Task --//
+"""
+
+# Each category is (instructions, timeout in seconds), in menu order
+CATEGORIES = {
+    "extraction": (
+        "Extract concrete entities only: phone numbers, email addresses, URLs, dates, people, "
+        "addresses, IDs and amounts. Use the plural entity name as the key (e.g. \"Phone Numbers\", "
+        "\"Email Addresses\") and join multiple values with newlines. For a single entity such as a "
+        "phone number, also include a normalized form (e.g. \"E.164 Format\": \"+15551234567\").",
+        6.0,
+    ),
+    "summary": (
+        "Describe the text. For prose or conversations return \"Summary\" and, where relevant, "
+        "\"Key Insights\", \"Action Items\" (as \"- [ ] \" lines) and \"Key Decisions\". For code return "
+        "\"Code Explanation\". Skip this entirely for a single short entity such as one email or number.",
+        8.0,
+    ),
+    "transformation": (
+        "Produce transformed versions of the text: reformatting (e.g. \"Prettified JSON\", \"Minified Code\"), "
+        "conversions and translations (e.g. \"Python Translation\", \"Python Dictionary\", \"Extracted JSON\") "
+        "and cleaned-up variants. Only include transformations that are genuinely useful for this text.",
+        12.0,
+    ),
+}
+
+
+class FanOutService(LLMService):
+    """Runs one focused Gemini request per category and merges the results."""
+
+    def __init__(self, service: GeminiService, categories: dict = None, pool: ThreadPoolExecutor = None):
+        self.service = service
+        self.categories = categories if categories is not None else CATEGORIES
+        self.pool = pool if pool is not None else _POOL
+
+    def _build_prompt(self, category: str, text: str, note: str = "") -> str:
+        instructions, _ = self.categories[category]
+        return _HEADER + instructions + f"""
+
+//-- Text to Analyze --//
+
+        ---
+        {text}
+        ---
+        """ + note
+
+    def _run(self, category: str, text: str, note: str = "", started: dict = None) -> dict:
+        if started is not None:
+            started[category] = time.monotonic()  # Deadlines count from here, not from submit
+        tier = self.service.policy.select(text)
+        # The HTTP timeout matches the category's, so a late request frees its worker
+        timeout = self.categories[category][1]
+        return self.service._generate(self._build_prompt(category, text, note), tier, timeout=timeout)
+
+    def _merge(self, results: dict) -> dict:
+        # Always in category order, so items don't jump around as results arrive
+        merged = {}
+        for category in self.categories:
+            result = results.get(category)
+            if isinstance(result, dict) and "error" not in result:
+                merged.update(result)
+        return merged
+
+    def analyze_progressive(self, text: str, on_update) -> dict:
+        """
+        Calls on_update(menu_data, done) each time a category finishes and
+        returns the final merged result. A category that misses its timeout
+        is left out rather than holding back the others. Timeouts count from
+        when a category starts running, so time queued behind other requests
+        on the shared pool doesn't use them up.
+        """
+        prepared = self.service._prepare(text)
+        note = PLACEHOLDER_NOTE if prepared.blobs else ""
+        started = {}
+        futures = {
+            self.pool.submit(self._run, category, prepared.text, note, started): category
+            for category in self.categories
+        }
+        results = {}
+        pending = set(futures)
+
+        def deadline(future):
+            category = futures[future]
+            if category not in started:
+                return time.monotonic() + _QUEUED_RECHECK  # Still queued; look again shortly
+            return started[category] + self.categories[category][1]
+
+        while pending:
+            remaining = min(deadline(f) for f in pending) - time.monotonic()
+            finished, pending = wait(pending, timeout=max(0.0, remaining), return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = {"error": str(e)}
+            now = time.monotonic()
+            expired = {f for f in pending if futures[f] in started and deadline(f) <= now}
+            for future in expired:
+                future.cancel()  # No-op once running; the HTTP timeout ends it
+                print(f"Category '{futures[future]}' timed out")
+            pending -= expired
+            if finished and pending:
+                on_update(prepared.restore(self._merge(results)), False)
+
+        merged = prepared.restore(self._merge(results))
+        if not merged:
+            errors = [r["error"] for r in results.values() if isinstance(r, dict) and "error" in r]
+            if errors:
+                merged = {"error": errors[0]}
+            elif len(results) < len(futures):
+                merged = {"error": "Analysis timed out."}
+        on_update(merged, True)
+        return merged
+
+    def analyze_text(self, text: str) -> dict:
+        return self.analyze_progressive(text, lambda data, done: None)
+
+    def get_stats(self) -> dict:
+        return self.service.get_stats()
+
+
+def fanout_enabled() -> bool:
+    return os.getenv(ANALYSIS_MODE_ENV, "").lower() == "fanout"
+
+
+if __name__ == "__main__":
+    # Compares time-to-first-item and time-to-complete for the single-call mode
+    # and the fan-out mode against simulated per-request latencies.
+    import threading
+
+    # Output length drives latency: the monolithic prompt writes every item in one response
+    latencies = {"extraction": 0.6, "summary": 0.9, "transformation": 2.4, "single": 3.2}
+    outputs = {
+        "extraction": {"Email Addresses": "ereed@email.com"},
+        "summary": {"Summary": "Daily exercise improves mood."},
+        "transformation": {"Extracted JSON": "{\"emails\": [\"ereed@email.com\"]}"},
+    }
+
+    class SimulatedGemini(GeminiService):
+        def _generate(self, prompt, tier, response_schema=None, timeout=15):
+            for category, (instructions, _) in CATEGORIES.items():
+                if instructions in prompt:
+                    time.sleep(latencies[category])
+                    return dict(outputs[category])
+            time.sleep(latencies["single"])
+            merged = {}
+            for output in outputs.values():
+                merged.update(output)
+            return merged
+
+    gemini = SimulatedGemini(api_key="benchmark-only")
+    text = "The study found that daily exercise improves mood. Contact Dr. Reed at ereed@email.com."
+
+    started = time.monotonic()
+    gemini.analyze_text(text)
+    single = time.monotonic() - started
+
+    first = []
+    lock = threading.Lock()
+
+    def on_update(data, done):
+        with lock:
+            if data and not first:
+                first.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    FanOutService(gemini).analyze_progressive(text, on_update)
+    complete = time.monotonic() - started
+
+    print(f"Single call: first item {single:.2f}s, complete {single:.2f}s")
+    print(f"Fan-out:     first item {first[0]:.2f}s, complete {complete:.2f}s")
@@ -0,0 +1,335 @@
+# llm_service.py
+import contextlib
+import os
+import requests
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+from .clip_cache import NearDuplicateCache
+from .model_policy import ModelTierPolicy
+from .profiling import profiled
+from .prompt_normalizer import NormalizedText, normalize_for_prompt, PLACEHOLDER_NOTE
+from .request_packing import plan_packs, build_batch_section, unpack_batch, BATCH_RESPONSE_SCHEMA
+
+# The "Interface" - any LLM class we create must follow this structure
+class LLMService(ABC):
+    @abstractmethod
+    def analyze_text(self, text: str) -> dict:
+        """
+        Analyzes the text and returns a dictionary of extracted information.
+        Example return:
+        {
+            "summary": "A concise summary of the text.",
+            "phone_numbers": ["+1-555-123-4567"],
+            "emails": ["test@example.com"]
+        }
+        """
+        pass
+
+    def analyze_batch(self, texts: list) -> list:
+        """
+        Analyzes several independent texts and returns one result dictionary
+        per text, in order. Services that can pack requests override this.
+        """
+        return [self.analyze_text(text) for text in texts]
+
+    def analyze_progressive(self, text: str, on_update) -> dict:
+        """
+        Like analyze_text, but calls on_update(menu_data, done) as results
+        arrive. Services that produce partial results override this.
+        """
+        result = self.analyze_text(text)
+        on_update(result, True)
+        return result
+
+# A concrete implementation for the Gemini API
+class GeminiService(LLMService):
+    def __init__(self, api_key: str, policy: ModelTierPolicy = None, normalize: bool = True):
+        if not api_key:
+            raise ValueError("API key for Gemini is missing.")
+        self.api_key = api_key
+        # Shrink whitespace, repeats, markup and blobs before they reach the prompt
+        self.normalize = normalize
+        # Chooses the model (and so the endpoint) for each request
+        self.policy = policy if policy is not None else ModelTierPolicy()
+        # Reuse connections (and their TLS handshakes) across requests
+        self.session = requests.Session()
+        # Optional context manager held around every upstream request (e.g. a quota)
+        self.limiter = None
+
+    def _api_url(self, model: str) -> str:
+        return f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={self.api_key}"
+
+    def get_stats(self) -> dict:
+        """Per-model-tier latency and cost stats."""
+        return self.policy.get_stats()
+
+    def _prepare(self, text: str) -> NormalizedText:
+        if not self.normalize:
+            return NormalizedText(text, text, {}, False, 0)
+        return normalize_for_prompt(text)
+
+    @profiled
+    def analyze_text(self, text: str) -> dict:
+        prepared = self._prepare(text)
+        prompt = self._build_prompt(prepared.text)
+        if prepared.blobs:
+            prompt += PLACEHOLDER_NOTE
+        tier = self.policy.select(prepared.text)
+        return prepared.restore(self._generate(prompt, tier))
+
+    def analyze_batch(self, texts: list) -> list:
+        """Packs small texts into shared requests; large ones still go alone."""
+        results = [None] * len(texts)
+        for pack in plan_packs(texts):
+            if len(pack) == 1:
+                results[pack[0]] = self.analyze_text(texts[pack[0]])
+                continue
+            prepared = [self._prepare(texts[index]) for index in pack]
+            items = [(str(n), p.text) for n, p in enumerate(prepared)]
+            tier = self.policy.select("\n".join(text for _, text in items))
+            prompt = self._build_batch_prompt(items)
+            if any(p.blobs for p in prepared):
+                prompt += PLACEHOLDER_NOTE
+            parsed = self._generate(prompt, tier, response_schema=BATCH_RESPONSE_SCHEMA)
+            if isinstance(parsed, dict) and "error" in parsed:
+                # The whole pack failed; every item gets the same error
+                for index in pack:
+                    results[index] = parsed
+                continue
+            # Any other reply that isn't the schema's array unpacks to nothing
+            unpacked = unpack_batch(parsed)
+            for n, index in enumerate(pack):
+                # Items the model dropped (or a malformed reply) are retried on their own
+                results[index] = prepared[n].restore(unpacked[str(n)]) if str(n) in unpacked else self.analyze_text(texts[index])
+        return results
+
+    def _generate(self, prompt: str, tier: dict, response_schema: dict = None, timeout: float = 15):
+        headers = {'Content-Type': 'application/json'}
+        data = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "response_mime_type": "application/json",
+            }
+        }
+        if response_schema:
+            data["generationConfig"]["response_schema"] = response_schema
+
+        with self.limiter if self.limiter is not None else contextlib.nullcontext():
+            started = time.monotonic()
+            try:
+                response = self.session.post(self._api_url(tier["model"]), headers=headers, json=data, timeout=timeout)
+                response.raise_for_status()  # Raise an exception for bad status codes
+                body = response.json()
+                usage = body.get('usageMetadata', {})
+                self.policy.record(tier, time.monotonic() - started,
+                                   input_tokens=usage.get('promptTokenCount', 0),
+                                   output_tokens=usage.get('candidatesTokenCount', 0))
+                result_text = body['candidates'][0]['content']['parts'][0]['text']
+                print(result_text)
+                return json.loads(result_text)
+            except requests.exceptions.RequestException as e:
+                self.policy.record(tier, time.monotonic() - started, ok=False)
+                print(f"API Request Error: {e}")
+                return {"error": "Failed to connect to API."}
+            except (KeyError, IndexError, json.JSONDecodeError) as e:
+                print(f"API Response Parsing Error: {e}")
+                return {"error": "Could not parse API response."}
+
+    def _build_prompt(self, text: str) -> str:
+        return self._instructions() + f"""//-- Text to Analyze --//
+
+        ---
+        {text}
+        ---
+        """
+
+    def _build_batch_prompt(self, items: list) -> str:
+        return self._instructions() + build_batch_section(items)
+
+    def _instructions(self) -> str:
+        # This prompt is key. It instructs the LLM to return structured JSON.
+        prompt = """You are the intelligent engine for "SuperCopy," a smart clipboard assistant. Your goal is to analyze the user's clipboard text, understand the user's likely intent, and generate a flat list of potential pasteable content in a JSON object.
+You should think in terms of potential data transformations, data cleaning, and value extraction from structured and unstructured data.
+//-- Core Directives --//
+
+Analyze & Generate Content: First, determine the content type (e.g., code, conversation, article, terms, etc.). Based on the type, generate a set of relevant, transformed content.
+
+Flat JSON Output ONLY: You MUST return ONLY a single, valid, flat JSON object. Do not use nested objects. Do not include any explanatory text, greetings, or markdown formatting like ```json.
+
+Keys are Content Titles: Every key in the JSON object must be a human-readable, concise title describing the content, which will be used as a menu item (e.g., "Summary", "Python Translation").
+
+Values are Pasteable Content: Every value must be the string of text that will be copied to the clipboard when the user selects the corresponding menu item.
+
+Omit If Not Applicable: If a transformation is irrelevant or yields no result, DO NOT include its key in the final JSON object. This keeps the user's menu clean and relevant.
+
+//-- Context-Specific Content & Key-Value Generation --//
+
+1. If the text is CODE:
+
+Example Input: function hello() { console.log("Hello, World!"); }
+
+Potential JSON Output:
+
+JSON
+
+{
+  "Code Explanation": "This is a JavaScript function named 'hello' that prints the string 'Hello, World!' to the console.",
+  "Python Translation": "def hello():\n    print(\"Hello, World!\")",
+  "Minified Code": "function hello(){console.log(\"Hello, World!\");}"
+}
+2. If the text is a MEETING TRANSCRIPT or CONVERSATION:
+
+Example Input: Alex: Can you send the report by Friday? Sarah: Yes, I'll get it done. Mark: Great. Also, we decided to move the launch to the 15th.
+
+Potential JSON Output:
+
+JSON
+
+{
+  "Summary": "Alex requested the report from Sarah by Friday, and Mark confirmed the project launch is moved to the 15th.",
+  "Action Items": "- [ ] Sarah to send the report by Friday.",
+  "Key Decisions": "- The project launch is moved to the 15th."
+}
+3. If the text is an ARTICLE or long block of text:
+
+Example Input: The study, conducted by researchers, found that daily exercise significantly improves mood. The lead author, Dr. Reed, can be reached at ereed@email.com.
+
+Potential JSON Output:
+
+JSON
+
+{
+  "Summary": "A recent study found that daily exercise significantly improves mood.",
+  "Key Insights": "- Daily exercise significantly improves mood.",
+  "Contact Info": "Dr. Reed\nereed@email.com",
+  "Extracted JSON": "{\"names\": [\"Dr. Reed\"], \"emails\": [\"ereed@email.com\"]}"
+}
+4. If the text is UNSTRUCTURED but contains a single, clear entity (e.g., just an email, a phone number, or JSON):
+
+Example Input 1: {"name":"John", "age":30}
+
+JSON
+
+{
+  "Prettified JSON": "{\n  \"name\": \"John\",\n  \"age\": 30\n}",
+  "Python Dictionary": "{\"name\": \"John\", \"age\": 30}"
+}
+Example Input 2: (555)-123-4567
+
+JSON
+
+{
+  "E.164 Format": "+15551234567"
+}
+//-- General Fallback --//
+If the text is simple and doesn't fit a complex category, perform basic extraction. The key should be the plural name of the entity found.
+
+Example Input: My number is 555-867-5309 and my email is jenny@example.com.
+
+Potential JSON Output:
+
+JSON
+
+{
+  "Phone Numbers": "555-867-5309",
+  "Email Addresses": "jenny@example.com"
+}
+"""
+        return prompt
+
+# A wrapper that serves repeated and almost-identical clips from a cache
+class CachedLLMService(LLMService):
+    def __init__(self, service: LLMService, cache: NearDuplicateCache = None, refresh_near_hits: bool = False):
+        self.service = service
+        self.cache = cache if cache is not None else NearDuplicateCache()
+        # When a near-duplicate is served, optionally re-analyze the new text in
+        # the background so the next copy of it gets an exact result.
+        self.refresh_near_hits = refresh_near_hits
+
+    def lookup(self, text: str):
+        """Returns the cached result for text (or a near-duplicate of it), else None."""
+        hit = self.cache.lookup(text)
+        if hit is None:
+            return None
+        result, exact = hit
+        if not exact and self.refresh_near_hits:
+            threading.Thread(target=self._analyze_and_store, args=(text,), daemon=True).start()
+        return result
+
+    def store(self, text: str, result: dict):
+        # Never cache failures, so the next copy gets a fresh attempt
+        if result and "error" not in result:
+            self.cache.store(text, result)
+
+    @profiled
+    def analyze_text(self, text: str) -> dict:
+        result = self.lookup(text)
+        if result is not None:
+            return result
+        return self._analyze_and_store(text)
+
+    def analyze_progressive(self, text: str, on_update) -> dict:
+        result = self.lookup(text)
+        if result is not None:
+            on_update(result, True)
+            return result
+        result = self.service.analyze_progressive(text, on_update)
+        self.store(text, result)
+        return result
+
+    def analyze_batch(self, texts: list) -> list:
+        results = [None] * len(texts)
+        misses = []
+        for index, text in enumerate(texts):
+            results[index] = self.lookup(text)
+            if results[index] is None:
+                misses.append(index)
+        if misses:
+            fresh = self.service.analyze_batch([texts[index] for index in misses])
+            for index, result in zip(misses, fresh):
+                results[index] = result
+                self.store(texts[index], result)
+        return results
+
+    def get_stats(self) -> dict:
+        stats = {"cache": dict(self.cache.stats)}
+        if hasattr(self.service, "get_stats"):
+            stats["models"] = self.service.get_stats()
+        return stats
+
+    def _analyze_and_store(self, text: str) -> dict:
+        result = self.service.analyze_text(text)
+        self.store(text, result)
+        return result
+
+# A stand-in service with a fixed latency, for load tests and simulations
+class FakeLLMService(LLMService):
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        # Same hook as GeminiService: held around each (simulated) upstream request
+        self.limiter = None
+
+    def analyze_text(self, text: str) -> dict:
+        with self.limiter if self.limiter is not None else contextlib.nullcontext():
+            with self._lock:
+                self.calls += 1
+            time.sleep(self.latency)
+        return {"Summary": text[:60], "Character Count": str(len(text))}
+
+# This function allows the main app to get a service without knowing the details
+def get_llm_service(api_key: str = None) -> LLMService:
+    # We could add logic here to choose between different services
+    # For the MVP, we will use Gemini.
+    if not api_key:
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+
+    if not api_key:
+        raise ValueError("API key is required. Either pass it directly or set GEMINI_API_KEY environment variable.")
+
+    return CachedLLMService(GeminiService(api_key=api_key))
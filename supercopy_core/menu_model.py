@@ -0,0 +1,70 @@
+# menu_model.py
+"""
+A platform-neutral description of the SuperCopy menu. The pipeline's render
+stage builds one from an analysis result; each tray app only turns it into
+its own menu widgets.
+"""
+
+PREVIEW_CHARS = 30
+
+
+def _preview(text: str) -> str:
+    return text[:PREVIEW_CHARS] + "..." if len(text) > PREVIEW_CHARS else text
+
+
+def _title(key: str) -> str:
+    return key.replace('_', ' ').title()
+
+
+class MenuEntry:
+    """One pasteable menu item."""
+
+    def __init__(self, label: str, value: str):
+        self.label = label
+        self.value = value
+
+    def __repr__(self):
+        return f"MenuEntry({self.label!r})"
+
+
+class MenuModel:
+    """
+    `kind` is "empty", "info", "warning", "error" or "items". `message` holds
+    the text for the first four; `entries` holds the pasteable items.
+    """
+
+    def __init__(self, kind: str, message: str = "", entries=None, original: str = ""):
+        self.kind = kind
+        self.message = message
+        self.entries = entries or []
+        self.original = original
+
+    @property
+    def original_label(self) -> str:
+        return f"Original: {self.original[:PREVIEW_CHARS]}..."
+
+    def __repr__(self):
+        return f"MenuModel({self.kind!r}, {self.message or self.entries!r})"
+
+
+def build_menu_model(data: dict, original: str = "") -> MenuModel:
+    """Turns a flat analysis result into menu entries."""
+    if not data:
+        return MenuModel("empty", original=original)
+    for kind in ("error", "warning", "info"):
+        if kind in data:
+            return MenuModel(kind, str(data[kind]), original=original)
+
+    entries = []
+    for key, value in data.items():
+        if not value:  # Skip empty values (empty lists, empty strings, None, etc.)
+            continue
+        if isinstance(value, list):
+            # For lists, join items and show preview + count
+            all_items = ", ".join(str(item) for item in value)
+            label = f"Paste All {_title(key)} ({len(value)}): {_preview(all_items)}"
+            entries.append(MenuEntry(label, all_items))
+        else:
+            value_str = value if isinstance(value, str) else str(value)
+            entries.append(MenuEntry(f"Paste {_title(key)}: {_preview(value_str)}", value_str))
+    return MenuModel("items", entries=entries, original=original)
@@ -0,0 +1,147 @@
+# model_policy.py
+import re
+import threading
+import time
+from collections import deque
+
+# Tiers are ordered from fastest/cheapest to strongest. Prices are approximate
+# list prices in USD per million tokens and only feed the cost estimate in stats.
+DEFAULT_TIERS = [
+    {
+        "name": "fast",
+        "model": "gemini-2.0-flash-lite",
+        "max_chars": 1500,
+        "latency_slo": 2.5,
+        "input_price": 0.075,
+        "output_price": 0.30,
+    },
+    {
+        "name": "standard",
+        "model": "gemini-2.0-flash",
+        "max_chars": 12000,
+        "latency_slo": 5.0,
+        "input_price": 0.10,
+        "output_price": 0.40,
+    },
+    {
+        "name": "strong",
+        "model": "gemini-2.5-flash",
+        "max_chars": None,
+        "latency_slo": 10.0,
+        "input_price": 0.30,
+        "output_price": 2.50,
+    },
+]
+
+_CODE_LINE_RE = re.compile(
+    r"^\s*(def |class |import |from \S+ import|function |const |let |var |return\b|if\s*\(|for\s*\(|#include|public |private |SELECT |<\w+)"
+    r"|[{};]\s*$"
+)
+
+
+def looks_like_code(text: str) -> bool:
+    """A cheap heuristic: a good share of the lines look like source code."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) < 3:
+        return False
+    code_lines = sum(1 for line in lines if _CODE_LINE_RE.search(line))
+    return code_lines / len(lines) >= 0.3
+
+
+class _TierState:
+    def __init__(self, tier: dict, window: int):
+        self.tier = tier
+        self.latencies = deque(maxlen=window)
+        self.degraded_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.downgrades = 0
+        self.total_latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def p90(self) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def cost(self) -> float:
+        return (self.input_tokens * self.tier["input_price"] + self.output_tokens * self.tier["output_price"]) / 1_000_000
+
+
+class ModelTierPolicy:
+    """
+    Picks a Gemini model per request from the size and shape of the input.
+    Short, simple clips go to the fastest tier; long or code-heavy clips to a
+    stronger one. When a tier's recent p90 latency exceeds its SLO it is
+    skipped for `cooldown` seconds and its traffic drops to the next faster tier.
+    """
+
+    def __init__(self, tiers=None, window: int = 20, min_samples: int = 3, cooldown: float = 120.0):
+        self.tiers = tiers if tiers is not None else DEFAULT_TIERS
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._states = {tier["name"]: _TierState(tier, window) for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    def _preferred_index(self, text: str) -> int:
+        index = next(
+            (i for i, tier in enumerate(self.tiers) if tier["max_chars"] is None or len(text) <= tier["max_chars"]),
+            len(self.tiers) - 1,
+        )
+        # Code benefits from a stronger model even when it is short
+        if looks_like_code(text):
+            index = min(index + 1, len(self.tiers) - 1)
+        return index
+
+    def select(self, text: str) -> dict:
+        """Returns the tier dict to use for `text`."""
+        index = self._preferred_index(text)
+        now = time.monotonic()
+        with self._lock:
+            for i in range(index, -1, -1):
+                state = self._states[self.tiers[i]["name"]]
+                if state.degraded_until <= now:
+                    if i != index:
+                        self._states[self.tiers[index]["name"]].downgrades += 1
+                    return self.tiers[i]
+        # Every candidate is over budget; the fastest one is still the best bet
+        return self.tiers[0]
+
+    def record(self, tier: dict, latency: float, ok: bool = True, input_tokens: int = 0, output_tokens: int = 0):
+        """Feeds back the observed latency and token usage of one request."""
+        with self._lock:
+            state = self._states[tier["name"]]
+            state.requests += 1
+            state.total_latency += latency
+            state.input_tokens += input_tokens
+            state.output_tokens += output_tokens
+            if not ok:
+                state.errors += 1
+            state.latencies.append(latency)
+            if len(state.latencies) >= self.min_samples and state.p90() > tier["latency_slo"]:
+                print(f"Model tier '{tier['name']}' over its {tier['latency_slo']}s latency SLO, downgrading for {self.cooldown:.0f}s")
+                state.degraded_until = time.monotonic() + self.cooldown
+                state.latencies.clear()
+
+    def get_stats(self) -> dict:
+        """Per-tier request counts, latency and estimated cost."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "model": state.tier["model"],
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "downgrades": state.downgrades,
+                    "avg_latency": state.total_latency / state.requests if state.requests else 0.0,
+                    "p90_latency": state.p90(),
+                    "latency_slo": state.tier["latency_slo"],
+                    "degraded": state.degraded_until > now,
+                    "input_tokens": state.input_tokens,
+                    "output_tokens": state.output_tokens,
+                    "estimated_cost_usd": round(state.cost(), 6),
+                }
+                for name, state in self._states.items()
+            }
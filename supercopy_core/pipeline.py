@@ -0,0 +1,375 @@
+# pipeline.py
+"""
+The clipboard-to-menu pipeline shared by both tray apps:
+
+    read -> origin -> normalize -> scan -> cache -> analyze -> render-model
+
+Reading through cache lookup is cheap and runs inline on every poll. Analysis
+runs on a worker thread behind a one-slot queue: if a newer clip arrives while
+one is still waiting, the waiting one is dropped, so a burst of copies never
+builds a backlog of LLM calls. Every stage is timed. Text SuperCopy itself
+put on the clipboard (see `Pipeline.copy`) stops at the origin stage, so
+picking a menu item never triggers a new analysis or replaces the menu.
+
+The platform apps only supply a clipboard read function and callbacks, so the
+whole pipeline runs headlessly (see `python -m supercopy_core.pipeline`).
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from .clip_cache import NearDuplicateCache, canonicalize
+from .clipboard_origin import ClipboardOrigin
+from .engine_daemon import connect_engine
+from .fanout_service import FanOutService, fanout_enabled
+from .llm_service import LLMService, GeminiService, CachedLLMService
+from .menu_model import build_menu_model
+from .profiling import profiled
+from .secret_scan import SECRET_WARNING, detect_secrets
+from .trace_replay import get_recorder
+
+
+def create_llm_service(api_key: str) -> LLMService:
+    """The service the tray apps analyze with: a running engine, else Gemini."""
+    service = GeminiService(api_key)
+    local = FanOutService(service) if fanout_enabled() else service
+    # Share a running engine daemon's cache and quota when there is one,
+    # falling back to the local service whenever it goes away
+    return connect_engine(fallback=local) or local
+
+
+class Clip:
+    """One clipboard value on its way through the pipeline."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.seen_at = time.monotonic()
+        self.key = ""          # Canonical form, set by NormalizeStage
+        self.secret = False
+        self.result = None     # Analysis result, once known
+        self.cached = False
+        self.menu = None       # MenuModel, set by RenderStage
+        self.generation = 0
+
+
+# --- Stages ---
+class Stage(ABC):
+    name = "stage"
+
+    @abstractmethod
+    def process(self, clip: Clip, emit) -> Clip:
+        """
+        Processes the clip and returns it, or returns None to stop it here.
+        Stages with partial output may call emit(clip) before returning.
+        """
+        pass
+
+
+class ClipboardReader:
+    """The read stage: turns clipboard polls into a Clip when the text changes."""
+    name = "read"
+
+    def __init__(self, read_clipboard):
+        self.read_clipboard = read_clipboard
+        self.last_text = ""
+
+    def read(self):
+        text = self.read_clipboard()
+        if not text or text == self.last_text:
+            return None
+        self.last_text = text
+        return Clip(text)
+
+
+class OriginStage(Stage):
+    name = "origin"
+
+    def __init__(self, origin: ClipboardOrigin = None):
+        self.origin = origin if origin is not None else ClipboardOrigin()
+
+    def process(self, clip, emit):
+        return None if self.origin.is_own_write(clip.text) else clip
+
+
+class NormalizeStage(Stage):
+    name = "normalize"
+
+    def process(self, clip, emit):
+        clip.key = canonicalize(clip.text)
+        return clip if clip.key else None
+
+
+class ScanStage(Stage):
+    name = "scan"
+
+    def __init__(self, detector=detect_secrets):
+        self.detector = detector
+
+    def process(self, clip, emit):
+        # Check for secrets before anything is cached or sent to the LLM
+        clip.secret = self.detector(clip.text)
+        if clip.secret:
+            clip.result = {"warning": SECRET_WARNING}
+        recorder = get_recorder()  # Opt-in via SUPERCOPY_TRACE
+        if recorder:
+            recorder.record_copy(clip.text, secret=clip.secret)
+        return clip
+
+
+class CacheStage(Stage):
+    """Looks clips up in, and stores results through, a CachedLLMService."""
+    name = "cache"
+
+    def __init__(self, cached: CachedLLMService):
+        self.cached = cached
+
+    def process(self, clip, emit):
+        if clip.result is None:
+            clip.result = self.cached.lookup(clip.text)
+            clip.cached = clip.result is not None
+        return clip
+
+    def store(self, clip: Clip):
+        if not clip.cached and not clip.secret:
+            self.cached.store(clip.text, clip.result)
+
+
+class AnalyzeStage(Stage):
+    name = "analyze"
+
+    def __init__(self, cached: CachedLLMService):
+        self.cached = cached
+
+    def process(self, clip, emit):
+        def on_update(data, done):
+            if not done and data:
+                clip.result = data
+                emit(clip)
+        try:
+            # CacheStage has already missed, so go straight to the wrapped service
+            clip.result = self.cached.service.analyze_progressive(clip.text, on_update)
+        except Exception as e:
+            clip.result = {"error": str(e)}
+        return clip
+
+
+class RenderStage(Stage):
+    name = "render"
+
+    def process(self, clip, emit):
+        clip.menu = build_menu_model(clip.result, clip.text)
+        return clip
+
+
+# --- Back-pressure ---
+class LatestSlot:
+    """A one-item queue where a new item replaces one that is still waiting."""
+
+    def __init__(self):
+        self._item = None
+        self._ready = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._ready:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._ready.notify()
+
+    def get(self):
+        with self._ready:
+            while self._item is None:
+                self._ready.wait()
+            item, self._item = self._item, None
+            return item
+
+
+# --- Pipeline ---
+class Pipeline:
+    """
+    Drives clips from the clipboard to a MenuModel.
+
+    on_menu(menu, done) receives every menu to show, including partial ones
+    while a progressive analysis is still running; menus for a clip that has
+    since been replaced are never delivered. on_status("processing"/"idle")
+    tracks whether an analysis is in flight. With threaded=False analysis runs
+    inline in poll(), which is handy for scripts and headless runs. With
+    refresh_near_hits, a clip served from a near-duplicate is re-analyzed in
+    the background so its next copy gets an exact result.
+    """
+
+    def __init__(self, service: LLMService, read_clipboard, on_menu, on_status=None,
+                 cache: NearDuplicateCache = None, detector=detect_secrets, threaded: bool = True,
+                 write_clipboard=None, origin: ClipboardOrigin = None, refresh_near_hits: bool = False):
+        self.reader = ClipboardReader(read_clipboard)
+        self.write_clipboard = write_clipboard
+        self.cached = CachedLLMService(service, cache, refresh_near_hits=refresh_near_hits)
+        self.origin_stage = OriginStage(origin)
+        self.normalize_stage = NormalizeStage()
+        self.cache_stage = CacheStage(self.cached)
+        self.front = [ScanStage(detector), self.cache_stage]
+        self.analyze_stage = AnalyzeStage(self.cached)
+        self.render_stage = RenderStage()
+        self.on_menu = on_menu
+        self.on_status = on_status or (lambda status: None)
+        self.threaded = threaded
+        self._slot = LatestSlot()
+        self._worker = None
+        self._generation = 0
+        # Makes the generation bump and each check-then-deliver atomic, so a
+        # superseded menu can never be delivered after a newer one
+        self._publish_lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self.timings = {}
+
+    @property
+    def last_text(self) -> str:
+        return self.reader.last_text
+
+    def set_service(self, service: LLMService):
+        """Swaps the LLM service (e.g. after a settings change), keeping the cache."""
+        self.cached.service = service
+
+    def _time(self, name: str, started: float):
+        elapsed = (time.perf_counter() - started) * 1000.0
+        with self._stats_lock:
+            stats = self.timings.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += elapsed
+            stats["max_ms"] = max(stats["max_ms"], elapsed)
+
+    def _run(self, stage: Stage, clip: Clip, emit=None):
+        started = time.perf_counter()
+        try:
+            return stage.process(clip, emit or (lambda c: None))
+        finally:
+            self._time(stage.name, started)
+
+    def _is_current(self, clip: Clip) -> bool:
+        return clip.generation == self._generation
+
+    def _publish(self, clip: Clip, done: bool):
+        clip = self._run(self.render_stage, clip)
+        with self._publish_lock:
+            if self._is_current(clip):
+                self.on_menu(clip.menu, done)
+                if done:
+                    self.on_status("idle")
+
+    def copy(self, text: str, parent: str = ""):
+        """Writes text to the clipboard as SuperCopy, so the next poll skips it."""
+        origin = self.origin_stage.origin
+        # Recorded first: poll() may run on another thread right after the write
+        origin.record_write(text, parent)
+        try:
+            self.write_clipboard(text)
+        except Exception:
+            origin.forget(text)
+            raise
+        origin.mark_written(text)
+
+    @profiled
+    def poll(self):
+        """Reads the clipboard once and pushes a new clip down the pipeline."""
+        started = time.perf_counter()
+        clip = self.reader.read()
+        self._time(self.reader.name, started)
+        if clip is None:
+            return
+        # Before the generation bump, so a clip dropped here never supersedes
+        # an analysis that is still running for the current menu
+        for stage in (self.origin_stage, self.normalize_stage):
+            clip = self._run(stage, clip)
+            if clip is None:
+                return
+        with self._publish_lock:
+            self._generation += 1
+            clip.generation = self._generation
+
+        for stage in self.front:
+            clip = self._run(stage, clip)
+            if clip is None:
+                return
+        if clip.result is not None:
+            self._publish(clip, True)
+            return
+
+        self.on_status("processing")
+        if self.threaded:
+            self._ensure_worker()
+            self._slot.put(clip)
+        else:
+            self._analyze(clip)
+
+    def _analyze(self, clip: Clip):
+        if not self._is_current(clip):
+            return
+        clip = self._run(self.analyze_stage, clip, emit=lambda c: self._publish(c, False))
+        self.cache_stage.store(clip)
+        self._publish(clip, True)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name="supercopy-analyze", daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            self._analyze(self._slot.get())
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stages = {
+                name: {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                }
+                for name, stats in self.timings.items()
+            }
+        stats = {
+            "stages": stages,
+            "dropped": self._slot.dropped,
+            "cache": dict(self.cached.cache.stats),
+            "own_writes": dict(self.origin_stage.origin.stats),
+        }
+        service = self.cached.service
+        if hasattr(service, "get_stats"):
+            stats["service"] = service.get_stats()
+        return stats
+
+
+if __name__ == "__main__":
+    # Runs the pipeline headlessly against a scripted clipboard and a fake LLM.
+    import json
+    from .llm_service import FakeLLMService
+
+    clipboard = [
+        "",
+        "The quarterly report is due Friday; please send it to alex@example.com.",
+        "The quarterly report is due Friday; please send it to alex@example.com.\n",
+        "hunter2",
+        "Meeting moved to Thursday 3pm in room 4B. Bring the Q3 numbers.",
+        "The quarterly report is due Friday;  please send it to alex@example.com.",
+    ]
+    menus = []
+    pipeline = Pipeline(
+        FakeLLMService(latency=0.05),
+        read_clipboard=lambda: clipboard[0],
+        on_menu=lambda menu, done: menus.append((menu, done)),
+        threaded=False,
+        write_clipboard=lambda text: clipboard.__setitem__(0, text),
+        origin=ClipboardOrigin(sequence_number=None),
+    )
+    while clipboard:
+        pipeline.poll()
+        if len(clipboard) == 2:
+            # The user picks the first menu entry; SuperCopy's own write is not re-analyzed
+            last = menus[-1][0]
+            pipeline.copy(last.entries[0].value, last.original)
+            pipeline.poll()
+        clipboard.pop(0)
+    for menu, done in menus:
+        print(f"{'final' if done else 'partial'}: {menu}")
+    print(json.dumps(pipeline.get_stats(), indent=2))
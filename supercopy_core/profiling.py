@@ -0,0 +1,280 @@
+# profiling.py
+"""
+On-demand profiling for the always-on tray process.
+
+Turn it on with SUPERCOPY_PROFILE=1 at launch, or from the "Start Profiling"
+menu item, which is only shown when SUPERCOPY_DEBUG_MENU=1. While it runs:
+
+- a sampling profiler records the stacks of threads inside a profiled
+  section (the clipboard monitor, analysis and menu builders) every few ms,
+- tracemalloc snapshots are taken at intervals and diffed against the last.
+  Allocations keep SUPERCOPY_PROFILE_MEMORY_FRAMES frames (default 1, which
+  is all the per-line diffs need; deeper traces slow allocation-heavy code
+  enough to distort the CPU profile, and 0 turns allocation tracing off).
+
+Under load the sampler wakes later than its interval, so each sample is
+weighted by the measured time since the previous one; pstats times are in
+those measured seconds, while profile.collapsed keeps raw sample counts.
+
+Output goes to SUPERCOPY_PROFILE_DIR (default ~/.supercopy_profiles/<timestamp>/):
+profile.pstats (load with `python -m pstats`), profile.collapsed (one
+"frame;frame;frame count" line per stack, for flamegraph.pl or speedscope),
+snapshot-N.tracemalloc and alloc-diff-N.txt.
+
+When profiling is off, a profiled call costs one global lookup.
+"""
+import functools
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+PROFILE_ENV = "SUPERCOPY_PROFILE"
+PROFILE_DIR_ENV = "SUPERCOPY_PROFILE_DIR"
+DEBUG_MENU_ENV = "SUPERCOPY_DEBUG_MENU"
+MEMORY_FRAMES_ENV = "SUPERCOPY_PROFILE_MEMORY_FRAMES"
+
+_active = None
+_active_lock = threading.Lock()
+
+
+class Profiler:
+    def __init__(self, out_dir: str, interval: float = 0.005, snapshot_interval: float = 60.0, top: int = 25,
+                 memory_frames: int = 1):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self.snapshot_interval = snapshot_interval
+        self.top = top
+        self._sections = {}  # thread id -> (section name, nesting depth)
+        self._sections_lock = threading.Lock()
+        self._stacks = Counter()
+        self._seconds = Counter()  # Measured time per stack, for pstats
+        self._stacks_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_snapshot = None
+        self._snapshot_count = 0
+        self._started_tracemalloc = False
+        self.samples = 0
+
+    # --- Sections ---
+    @contextmanager
+    def section(self, name: str):
+        thread_id = threading.get_ident()
+        with self._sections_lock:
+            outer, depth = self._sections.get(thread_id, (name, 0))
+            self._sections[thread_id] = (outer, depth + 1)
+        try:
+            yield
+        finally:
+            with self._sections_lock:
+                outer, depth = self._sections[thread_id]
+                if depth == 1:
+                    del self._sections[thread_id]
+                else:
+                    self._sections[thread_id] = (outer, depth - 1)
+
+    # --- Sampling ---
+    def _sample_loop(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            # The real gap, which can be much longer than the interval under load
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            with self._sections_lock:
+                active = dict(self._sections)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, (name, _) in active.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.append(("~", 0, f"[{name}]"))
+                stack = tuple(reversed(stack))
+                with self._stacks_lock:
+                    self._stacks[stack] += 1
+                    self._seconds[stack] += elapsed
+                    self.samples += 1
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self.dump()
+
+    # --- Output ---
+    def _write_collapsed(self, stacks):
+        path = os.path.join(self.out_dir, "profile.collapsed")
+        with open(path, "w") as f:
+            for stack, count in stacks.items():
+                frames = ";".join(
+                    name if filename == "~" else f"{name} ({os.path.basename(filename)}:{line})"
+                    for filename, line, name in stack
+                )
+                f.write(f"{frames} {count}\n")
+
+    def _write_pstats(self, stacks, seconds):
+        # Builds the marshalled dict pstats.Stats loads: func -> (cc, nc, tt, ct, callers),
+        # with sample counts as call counts and measured seconds as times.
+        own, total = Counter(), Counter()
+        own_time, total_time = Counter(), Counter()
+        callers = defaultdict(Counter)
+        caller_time = defaultdict(Counter)
+        for stack, count in stacks.items():
+            elapsed = seconds[stack]
+            stack = stack[1:]  # Drop the section marker
+            if not stack:
+                continue
+            own[stack[-1]] += count
+            own_time[stack[-1]] += elapsed
+            for func in set(stack):
+                total[func] += count
+                total_time[func] += elapsed
+            for caller, callee in zip(stack, stack[1:]):
+                if caller != callee:
+                    callers[callee][caller] += count
+                    caller_time[callee][caller] += elapsed
+        stats = {}
+        for func in total:
+            caller_stats = {
+                caller: (n, n, caller_time[func][caller], caller_time[func][caller])
+                for caller, n in callers[func].items()
+            }
+            stats[func] = (total[func], total[func], own_time[func], total_time[func], caller_stats)
+        with open(os.path.join(self.out_dir, "profile.pstats"), "wb") as f:
+            marshal.dump(stats, f)
+
+    def _write_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        self._snapshot_count += 1
+        snapshot.dump(os.path.join(self.out_dir, f"snapshot-{self._snapshot_count}.tracemalloc"))
+        path = os.path.join(self.out_dir, f"alloc-diff-{self._snapshot_count}.txt")
+        with open(path, "w") as f:
+            if self._last_snapshot is None:
+                f.write(f"Top {self.top} allocations (first snapshot)\n")
+                for stat in snapshot.statistics("lineno")[:self.top]:
+                    f.write(f"{stat}\n")
+            else:
+                f.write(f"Top {self.top} allocation changes since snapshot-{self._snapshot_count - 1}\n")
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:self.top]:
+                    f.write(f"{stat}\n")
+        self._last_snapshot = snapshot
+
+    def dump(self):
+        """Writes the profile so far and a new allocation snapshot."""
+        with self._stacks_lock:
+            stacks = Counter(self._stacks)
+            seconds = Counter(self._seconds)
+        try:
+            self._write_collapsed(stacks)
+            self._write_pstats(stacks, seconds)
+            if tracemalloc.is_tracing():
+                self._write_snapshot()
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+
+    # --- Lifecycle ---
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self.memory_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.memory_frames)
+            self._started_tracemalloc = True
+        if tracemalloc.is_tracing():
+            self._write_snapshot()
+        for target in (self._sample_loop, self._snapshot_loop):
+            thread = threading.Thread(target=target, name="supercopy-profiler", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self.dump()
+        # Tracing that was on before profiling started (e.g. PYTHONTRACEMALLOC) stays on
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+def start_profiling(out_dir: str = None) -> Profiler:
+    global _active
+    with _active_lock:
+        if _active is not None:
+            return _active
+        if out_dir is None:
+            base = os.path.expanduser(os.getenv(PROFILE_DIR_ENV, "~/.supercopy_profiles"))
+            out_dir = os.path.join(base, time.strftime("%Y%m%d-%H%M%S"))
+        try:
+            memory_frames = int(os.getenv(MEMORY_FRAMES_ENV, "1"))
+        except ValueError:
+            memory_frames = 1
+        profiler = Profiler(out_dir, memory_frames=memory_frames)
+        profiler.start()
+        _active = profiler
+    print(f"Profiling to {out_dir}")
+    return profiler
+
+
+def stop_profiling():
+    """Stops profiling and returns the output directory, or None if it wasn't running."""
+    global _active
+    with _active_lock:
+        profiler, _active = _active, None
+    if profiler is None:
+        return None
+    profiler.stop()
+    print(f"Profile written to {profiler.out_dir}")
+    return profiler.out_dir
+
+
+def is_profiling() -> bool:
+    return _active is not None
+
+
+def toggle_profiling():
+    return stop_profiling() if is_profiling() else start_profiling().out_dir
+
+
+def start_from_env():
+    if os.getenv(PROFILE_ENV, "").lower() in ("1", "true", "yes"):
+        start_profiling()
+
+
+def debug_menu_enabled() -> bool:
+    return is_profiling() or os.getenv(DEBUG_MENU_ENV, "").lower() in ("1", "true", "yes")
+
+
+def profiled(func):
+    """Marks a function as a profiled section; free when profiling is off."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return func(*args, **kwargs)
+        with profiler.section(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def profile_section(name: str):
+    """Marks a block as a profiled section, for loop bodies that can't be decorated."""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    with profiler.section(name):
+        yield
@@ -0,0 +1,395 @@
+# prompt_normalizer.py
+"""
+Shrinks clipboard text before it goes into a prompt.
+
+Copied text often carries long runs of whitespace, repeated log lines, HTML
+and markdown residue and large base64 blobs, all of which cost prefill time
+without helping the analysis. The normalizer streams the text line by line:
+
+-   Long opaque blobs (base64, hex) become placeholders such as
+    [[blob1: base64, 4096 chars]]. The mapping is kept, and `restore()` puts
+    the original back into any pasteable value that references a placeholder.
+-   Runs of spaces and tabs collapse to one space, and runs of blank lines to
+    one blank line.
+-   Repeated consecutive lines collapse to the first one plus a repeat count.
+    Log lines that differ only in their leading timestamp count as repeats,
+    and the folded line keeps the first and last timestamp.
+-   HTML tags and entities, and markdown emphasis, headings and link syntax,
+    are stripped. Only known HTML tag names count as tags, so generics like
+    List<String> survive.
+
+Code is guarded: when the text looks like source code, is mostly indented,
+is valid JSON, or is a short snippet with code signals (braces, calls,
+operators), only blobs are elided, since whitespace and markup can be
+meaningful there. In longer text, single lines with code signals and fenced
+code blocks are passed through the same way.
+
+    python -m supercopy_core.prompt_normalizer   # token and latency benchmark
+"""
+import html
+import json
+import re
+
+from .model_policy import looks_like_code
+
+# Opaque runs shorter than this are left alone (hashes, IDs and keys stay readable)
+MIN_BLOB_CHARS = 200
+
+_BASE64_RE = re.compile(r"(?:data:[\w/+.-]+;base64,)?[A-Za-z0-9+/_-]{%d,}={0,2}" % MIN_BLOB_CHARS)
+_HEX_RE = re.compile(r"\b[0-9a-fA-F]{%d,}\b" % MIN_BLOB_CHARS)
+# Added to the prompt when the text has placeholders
+PLACEHOLDER_NOTE = (
+    "//-- Note --//\nPlaceholders like [[blob1: base64, 4096 chars]] stand for long data removed from the text. "
+    "Copy a placeholder unchanged wherever that data belongs in a value; never invent its contents.\n"
+)
+_PLACEHOLDER_RE = re.compile(r"\[\[(blob\d+)(?::[^\[\]]*)?\]\]")
+
+# A timestamp at the start of a log line, optionally in brackets
+_LOG_PREFIX_RE = re.compile(
+    r"^\[?(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+    r"|\d{2}:\d{2}:\d{2}(?:[.,]\d+)?)\]?\s"
+)
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+_HTML_TAG_RE = re.compile(r"</?([A-Za-z][\w:-]*)(?:\s[^<>]*)?/?>")
+_HTML_TAGS = frozenset(
+    "a abbr b big blockquote body br center cite code col colgroup dd del div dl dt em font h1 h2 h3 h4 h5 h6 "
+    "head hr html i img ins kbd li link meta ol p pre q s small span strike strong sub sup table tbody td tfoot "
+    "th thead title tr tt u ul".split()
+)
+_HTML_BLOCK_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE)
+_HTML_BLOCK_OPEN_RE = re.compile(r"<(script|style)\b", re.IGNORECASE)
+_MD_IMAGE_LINK_RE = re.compile(r"!?\[([^\]]*)\]\(([^)\s]+)[^)]*\)")
+_MD_HEADING_RE = re.compile(r"^#{1,6}\s+")
+_MD_EMPHASIS_RE = re.compile(r"(\*\*|__)(\S(?:.*?\S)?)\1")
+_MD_QUOTE_RE = re.compile(r"^(?:>\s?)+")
+
+# Signs that a line is code rather than prose: braces, calls, statement ends,
+# dunders and operators. Entities like &nbsp; don't count as statement ends.
+_CODE_SIGNAL_RE = re.compile(r"[{}]|(?<![a-z]);\s*$|\w\(|(?<![\w.])__\w|\w__\b|&&|\|\||[=!]=|=>|->")
+# Comparison operators look like stray tags, so they only count for short texts
+_OPERATOR_RE = re.compile(r"\w\s*[<>]=?\s*\w")
+# Texts with fewer non-blank lines than this are guarded on any code signal
+SHORT_TEXT_LINES = 3
+
+
+class NormalizedText:
+    """The prompt-ready text plus what is needed to map results back to the original."""
+
+    def __init__(self, original: str, text: str, blobs: dict, code: bool, repeats: int):
+        self.original = original
+        self.text = text
+        self.blobs = blobs      # placeholder id -> original blob
+        self.code = code        # True when the code guard kept the text as it was
+        self.repeats = repeats  # Lines folded into a repeat count
+
+    @property
+    def saved_chars(self) -> int:
+        return len(self.original) - len(self.text)
+
+    def restore(self, result):
+        """Puts elided blobs back into the pasteable values of an analysis result."""
+        if not self.blobs or not isinstance(result, dict):
+            return result
+        expand = lambda match: self.blobs.get(match.group(1), match.group(0))
+        restored = {}
+        for key, value in result.items():
+            if isinstance(value, str):
+                value = _PLACEHOLDER_RE.sub(expand, value)
+            elif isinstance(value, list):
+                value = [_PLACEHOLDER_RE.sub(expand, v) if isinstance(v, str) else v for v in value]
+            restored[key] = value
+        return restored
+
+
+def _is_json(text: str) -> bool:
+    stripped = text.strip()
+    if stripped[:1] not in ("{", "["):
+        return False
+    try:
+        json.loads(stripped)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_code(text: str) -> bool:
+    if looks_like_code(text) or _is_json(text):
+        return True
+    lines = [line for line in text.splitlines() if line.strip()]
+    # looks_like_code needs a few lines to judge; one-liners go on any signal
+    if len(lines) < SHORT_TEXT_LINES:
+        return any(_CODE_SIGNAL_RE.search(line) or _OPERATOR_RE.search(line) for line in lines)
+    # Indentation-structured text (YAML, Python without keywords, outlines)
+    indented = sum(1 for line in lines if line[:1] in (" ", "\t"))
+    return len(lines) >= 3 and indented / len(lines) >= 0.3
+
+
+class _BlobElider:
+    def __init__(self):
+        self.blobs = {}
+
+    def _replace(self, match, kind):
+        blob = match.group(0)
+        name = f"blob{len(self.blobs) + 1}"
+        self.blobs[name] = blob
+        return f"[[{name}: {kind}, {len(blob)} chars]]"
+
+    def __call__(self, line: str) -> str:
+        if len(line) < MIN_BLOB_CHARS:
+            return line
+        line = _HEX_RE.sub(lambda m: self._replace(m, "hex"), line)
+        return _BASE64_RE.sub(lambda m: self._replace(m, "base64"), line)
+
+
+def _strip_tag(match) -> str:
+    name = match.group(1)
+    # <List> or <Table> in prose is a type name, not a tag
+    if name.lower() in _HTML_TAGS and (name.islower() or name.isupper()):
+        return " "
+    return match.group(0)
+
+
+def _strip_markup(line: str) -> str:
+    if "<" in line:
+        line = _HTML_TAG_RE.sub(_strip_tag, line)
+    if "&" in line:
+        line = html.unescape(line)
+    line = _MD_QUOTE_RE.sub("", line)
+    line = _MD_HEADING_RE.sub("", line)
+    line = _MD_IMAGE_LINK_RE.sub(lambda m: f"{m.group(1)} ({m.group(2)})" if m.group(1) else m.group(2), line)
+    return _MD_EMPHASIS_RE.sub(r"\2", line)
+
+
+def normalize_lines(lines, elide, stats: dict = None):
+    """
+    Yields normalized lines one at a time, so long inputs are never copied
+    whole. Only a little state is kept between lines: whether we are inside a
+    code fence or a script/style block, and the current run of repeats.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("repeats", 0)
+    in_fence = False
+    in_block = None  # Closing tag of an open <script>/<style> block
+    blank = False
+    run_line, run_key, run_count = None, None, 0
+    run_first, run_last = None, None  # Timestamps of the first and last line in the run
+
+    def flush():
+        if run_count > 1:
+            stats["repeats"] += run_count - 1
+            if run_first is not None and run_last != run_first:
+                return f"{run_line} [repeated {run_count} times, {run_first}\u2013{run_last}]"
+            return f"{run_line} [repeated {run_count} times]"
+        return run_line
+
+    for line in lines:
+        fence = _FENCE_RE.match(line)
+        if in_fence or fence:
+            if fence:
+                in_fence = not in_fence
+            if run_line is not None:
+                yield flush()
+                run_line, run_key, run_count = None, None, 0
+            blank = False
+            yield elide(line)
+            continue
+
+        if in_block:
+            end = line.lower().find(in_block)
+            if end < 0:
+                continue
+            line, in_block = line[line.find(">", end) + 1:], None
+        line = _HTML_BLOCK_RE.sub(" ", line)
+        opened = _HTML_BLOCK_OPEN_RE.search(line)
+        if opened:
+            line, in_block = line[:opened.start()], f"</{opened.group(1).lower()}"
+
+        if _CODE_SIGNAL_RE.search(line):
+            # A code line inside prose keeps its markup and spacing
+            if run_line is not None:
+                yield flush()
+                run_line, run_key, run_count = None, None, 0
+            blank = False
+            yield elide(line.rstrip())
+            continue
+
+        # Markup first, so a blob inside a tag or link goes with it
+        line = _SPACES_RE.sub(" ", elide(_strip_markup(line))).strip()
+        if not line:
+            if run_line is not None:
+                yield flush()
+                run_line, run_key, run_count = None, None, 0
+            if not blank:
+                blank = True
+                yield ""
+            continue
+        blank = False
+
+        # Only a leading log timestamp is ignored; any other difference breaks the run
+        stamp = _LOG_PREFIX_RE.match(line)
+        key = (True, line[stamp.end():]) if stamp else (False, line)
+        if key == run_key:
+            run_count += 1
+            run_last = stamp.group(1) if stamp else None
+            continue
+        if run_line is not None:
+            yield flush()
+        run_line, run_key, run_count = line, key, 1
+        run_first = run_last = stamp.group(1) if stamp else None
+
+    if run_line is not None:
+        yield flush()
+
+
+def normalize_for_prompt(text: str) -> NormalizedText:
+    """Returns the prompt-ready form of a clipboard text."""
+    elide = _BlobElider()
+    if _is_code(text):
+        # Code guard: blobs are the only change, and restore() undoes them
+        return NormalizedText(text, elide(text), elide.blobs, True, 0)
+    stats = {}
+    normalized = "\n".join(normalize_lines(text.splitlines(), elide, stats)).strip("\n")
+    if not normalized.strip():
+        # Never send an empty prompt for text that was all markup
+        return NormalizedText(text, text, {}, False, 0)
+    return NormalizedText(text, normalized, elide.blobs, False, stats["repeats"])
+
+
+if __name__ == "__main__":
+    # Measures prompt tokens and simulated end-to-end latency on a fixture
+    # corpus of typical clipboard contents, with and without normalization.
+    import base64
+    import random
+    import statistics
+    import time
+
+    from .llm_service import GeminiService
+
+    rng = random.Random(7)
+
+    def fake_base64(size):
+        return base64.b64encode(bytes(rng.getrandbits(8) for _ in range(size))).decode()
+
+    log_lines = []
+    for second in range(60):
+        stamp = f"2024-06-03T14:{second // 60 + 12:02d}:{second % 60:02d}.{rng.randint(0, 999):03d}Z"
+        if second % 15 == 14:
+            log_lines.append(f"{stamp} ERROR payment-worker  Timeout talking to ledger (attempt 3/3) order=88412")
+        else:
+            log_lines.append(f"{stamp} WARN  payment-worker  Retrying connection to ledger-db:5432")
+
+    corpus = {
+        "server log": "\n".join(log_lines),
+        "web page residue": (
+            "Hi&nbsp;team,<br><br>\n"
+            "The <b>Q3 offsite</b> is confirmed for <strong>Sept 12&ndash;13</strong> in Denver.   "
+            "Please book travel by <em>Aug 20</em> and send receipts to travel@example.com.<br>\n\n\n\n"
+            "Agenda: <a href=\"https://intranet.example.com/offsite\" target=\"_blank\">intranet.example.com/offsite</a>"
+            "<style>.x { color: red; } .y { margin: 0 auto; }</style>\n"
+            f"Logo <img src=\"data:image/png;base64,{fake_base64(3000)}\" alt=\"logo\" width=\"120\">\n"
+            "Thanks,&nbsp;&nbsp;&nbsp;Dana<br>\n"
+            "<span style=\"font-size:9px;color:#999\">Sent from my phone</span>"
+        ),
+        "markdown notes": (
+            "# Release checklist\n\n\n"
+            "> **Owner:** Priya   |   **Due:** Friday\n\n"
+            "## Steps\n\n"
+            "- [ ]   Tag the release in [GitHub](https://github.com/example/app/releases)\n"
+            "- [ ]   Update the    **changelog**\n"
+            "- [ ]   Notify #release-announce\n\n"
+            "```bash\n"
+            "git tag -a v2.4.0 -m \"Release 2.4.0\"\n"
+            "git push origin v2.4.0\n"
+            "```\n\n\n\n"
+            f"![build badge](data:image/svg+xml;base64,{fake_base64(1200)})\n"
+        ),
+        "api response": (
+            "{\n"
+            "  \"id\": \"doc_8841\",\n"
+            "  \"owner\": \"ereed@email.com\",\n"
+            f"  \"content\": \"{fake_base64(6000)}\",\n"
+            "  \"sha256\": \"9f2b5c1e4a7d3086b2f41c9e5d7a6b3c8e1f0a2d4c6b8e0f1a3c5d7e9b2f4a6c\",\n"
+            "  \"created\": \"2024-06-03T14:12:00Z\"\n"
+            "}"
+        ),
+        "chat transcript": "\n".join(
+            f"{name}:      {message}\n\n\n"
+            for name, message in [
+                ("Alex", "Can    you send the report by   Friday?"),
+                ("Sarah", "Yes,  I'll get it done.   Will cc Mark."),
+                ("Alex", "Great -  also book the room for the review."),
+                ("Sarah", "Done,   room 4B at 3pm."),
+            ]
+        ),
+        "python code": (
+            "def retry(fn, attempts=3):\n"
+            "    for attempt in range(attempts):\n"
+            "        try:\n"
+            "            return fn()\n"
+            "        except IOError:\n"
+            "            time.sleep(2 ** attempt)   # back off\n"
+            "    raise RuntimeError(\"gave up\")\n"
+        ),
+        "short entity": "(555)-123-4567",
+    }
+
+    service = GeminiService(api_key="benchmark-only")
+
+    def tokens(chars):
+        return chars // 4
+
+    # A latency model for a flash-class model: fixed overhead, prefill per
+    # prompt token and decode for a typical ~150 token answer.
+    def simulated_latency(prompt_tokens):
+        return 0.30 + prompt_tokens * 0.00012 + 150 * 0.004
+
+    print(f"{'fixture':16} {'tokens':>7} {'-> norm':>7} {'saved':>6} {'latency':>8} {'-> norm':>8} {'norm ms':>8}  notes")
+    totals = [0, 0]
+    latencies = [[], []]
+    for name, text in corpus.items():
+        started = time.perf_counter()
+        for _ in range(20):
+            normalized = normalize_for_prompt(text)
+        norm_ms = (time.perf_counter() - started) * 1000.0 / 20
+        before = tokens(len(service._build_prompt(text)))
+        after = tokens(len(service._build_prompt(normalized.text)) + (len(PLACEHOLDER_NOTE) if normalized.blobs else 0))
+        totals[0] += before
+        totals[1] += after
+        latency_before = simulated_latency(before)
+        latency_after = simulated_latency(after) + norm_ms / 1000.0
+        latencies[0].append(latency_before)
+        latencies[1].append(latency_after)
+        notes = []
+        if normalized.code:
+            notes.append("code guard")
+        if normalized.blobs:
+            notes.append(f"{len(normalized.blobs)} blob(s)")
+            # Every placeholder must map back to the exact original text
+            sample = {"Restored": " ".join(f"[[{blob}]]" for blob in normalized.blobs)}
+            assert normalized.restore(sample)["Restored"] == " ".join(normalized.blobs.values())
+        if normalized.repeats:
+            notes.append(f"{normalized.repeats} repeated line(s)")
+        print(f"{name:16} {before:7} {after:7} {1 - after / before:6.0%} {latency_before:7.2f}s {latency_after:7.2f}s {norm_ms:8.2f}  {', '.join(notes)}")
+
+    print(f"\nTotal prompt tokens: {totals[0]} -> {totals[1]} ({1 - totals[1] / totals[0]:.0%} saved)")
+    print(f"Mean simulated latency: {statistics.mean(latencies[0]):.2f}s -> {statistics.mean(latencies[1]):.2f}s")
+    # The code guard must leave code and JSON byte-for-byte unchanged
+    unchanged = [
+        corpus["python code"],
+        "def f(*args, **kwargs): return g(**kwargs)",
+        "if (a<b && c>d) { x = 1; }",
+        '{"name": "John    Smith", "tag": "<b>x</b>"}',
+        "function hello() { console.log(\"Hello, World!\"); }",
+        "SELECT  id,   name FROM users WHERE age >= 30",
+    ]
+    for snippet in unchanged:
+        assert normalize_for_prompt(snippet).text == snippet, snippet
+    assert "obj.__init__" in normalize_for_prompt("Call   obj.__init__ first, then **run** it.\nDone.").text
+    # Times inside prose are content, and type parameters are not tags
+    trains = "Train departs 08:15:00 from Platform 1\nTrain departs 09:45:00 from Platform 1"
+    assert normalize_for_prompt(trains).text == trains
+    assert "List<String>" in normalize_for_prompt("Change the field type to List<String> before merge.\nThanks.").text
+    folded = normalize_for_prompt("10:00:01 WARN retrying\n10:02:01 WARN retrying\n10:05:01 WARN retrying").text
+    assert folded == "10:00:01 WARN retrying [repeated 3 times, 10:00:01\u201310:05:01]", folded
@@ -0,0 +1,129 @@
+# request_packing.py
+"""
+Packs several independent clipboard texts into one generateContent request.
+
+Every request repeats the full SuperCopy instructions, so a backlog of short
+clips is dominated by prompt overhead. A pack sends the instructions once,
+followed by each text under its own id, and asks for an array of per-item
+results that is unpacked back into the usual flat dictionaries.
+"""
+
+# Items larger than this always get a request of their own
+MAX_ITEM_CHARS = 4000
+# Limits for a single packed request
+MAX_PACK_CHARS = 12000
+MAX_PACK_ITEMS = 8
+
+BATCH_INSTRUCTIONS = """//-- Batch Mode --//
+Below are several INDEPENDENT clipboard texts, each introduced by its id. Analyze each text on its own, exactly as described above, as if it were the only text.
+Return a JSON array with one object per text, in any order: {"id": "<the text's id>", "entries": [{"title": "<content title>", "value": "<pasteable content>"}]}.
+Each "title"/"value" pair is one key/value of the flat JSON object you would have returned for that text alone. Never mix content between texts.
+"""
+
+# Gemini structured output schema for a packed response
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "STRING"},
+            "entries": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "title": {"type": "STRING"},
+                        "value": {"type": "STRING"},
+                    },
+                    "required": ["title", "value"],
+                },
+            },
+        },
+        "required": ["id", "entries"],
+    },
+}
+
+
+def plan_packs(texts, max_item_chars=MAX_ITEM_CHARS, max_pack_chars=MAX_PACK_CHARS, max_pack_items=MAX_PACK_ITEMS):
+    """
+    Groups text indexes into packs. Large texts go alone; the rest are packed
+    greedily in their original order within the size and count limits.
+    """
+    packs, current, current_chars = [], [], 0
+    for index, text in enumerate(texts):
+        if len(text) > max_item_chars:
+            packs.append([index])
+            continue
+        if current and (current_chars + len(text) > max_pack_chars or len(current) >= max_pack_items):
+            packs.append(current)
+            current, current_chars = [], 0
+        current.append(index)
+        current_chars += len(text)
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_batch_section(items) -> str:
+    """Formats (id, text) pairs for the end of a packed prompt."""
+    parts = [BATCH_INSTRUCTIONS]
+    for item_id, text in items:
+        parts.append(f"--- id: {item_id} ---\n{text}\n--- end: {item_id} ---\n")
+    return "\n".join(parts)
+
+
+def unpack_batch(parsed) -> dict:
+    """Maps each id in a packed response to its flat result dictionary."""
+    results = {}
+    if not isinstance(parsed, list):
+        return results
+    for item in parsed:
+        if not isinstance(item, dict) or "id" not in item:
+            continue
+        flat = {}
+        for entry in item.get("entries") or []:
+            if isinstance(entry, dict) and entry.get("title") and entry.get("value"):
+                flat[entry["title"]] = entry["value"]
+        results[str(item["id"])] = flat
+    return results
+
+
+if __name__ == "__main__":
+    # Compares requests and estimated prompt tokens per item with and without
+    # packing on a small backlog of typical clips (about 4 characters per token).
+    from .llm_service import GeminiService
+
+    backlog = [
+        "(555)-123-4567",
+        "jenny@example.com, call me at 555-867-5309 after 5pm",
+        '{"name":"John", "age":30, "city":"Boston"}',
+        "Alex: Can you send the report by Friday? Sarah: Yes, I'll get it done.",
+        "function hello() { console.log(\"Hello, World!\"); }",
+        "Meeting moved to Thursday 3pm in room 4B. Bring the Q3 numbers.",
+        "https://example.com/docs/getting-started?ref=newsletter",
+        "The study found that daily exercise significantly improves mood. Contact Dr. Reed at ereed@email.com.",
+        "SELECT id, name FROM users WHERE created_at > '2024-01-01' ORDER BY name;",
+        "Invoice #4821 due 2024-07-01, total $1,240.50, pay to ACME Corp, IBAN DE89370400440532013000",
+        "Lorem ipsum dolor sit amet. " * 200,
+        "Shipping address: 221B Baker Street, London NW1 6XE, United Kingdom",
+    ]
+    service = GeminiService(api_key="benchmark-only")
+
+    def tokens(chars):
+        return chars // 4
+
+    single_tokens = sum(tokens(len(service._build_prompt(text))) for text in backlog)
+    packed_calls, packed_tokens = 0, 0
+    for pack in plan_packs(backlog):
+        packed_calls += 1
+        if len(pack) == 1:
+            packed_tokens += tokens(len(service._build_prompt(backlog[pack[0]])))
+        else:
+            items = [(str(i), backlog[i]) for i in pack]
+            packed_tokens += tokens(len(service._build_batch_prompt(items)))
+
+    count = len(backlog)
+    print(f"Items: {count}")
+    print(f"Unpacked: {count} calls, {single_tokens} prompt tokens, {single_tokens / count:.0f} tokens/item")
+    print(f"Packed:   {packed_calls} calls, {packed_tokens} prompt tokens, {packed_tokens / count:.0f} tokens/item")
+    print(f"Calls per item: {1.0:.2f} -> {packed_calls / count:.2f}  Prompt tokens saved: {1 - packed_tokens / single_tokens:.0%}")
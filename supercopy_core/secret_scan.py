@@ -0,0 +1,16 @@
+# secret_scan.py
+
+SECRET_WARNING = "Secrets detected: Skipping analysis"
+
+
+def detect_secrets(text: str) -> bool:
+    """Detect if text contains sensitive information like passwords"""
+    # Simple rule: if it's a single string with no spaces and under 30 characters,
+    # it's likely a password or sensitive token
+    text = text.strip()
+
+    # Check if it's a single string with no spaces and under 30 characters
+    if len(text) < 30 and ' ' not in text and len(text) > 0:
+        return True
+
+    return False
@@ -0,0 +1,413 @@
+# trace_replay.py
+"""
+Opt-in clipboard trace recording and an offline replay simulator.
+
+Recording is enabled by pointing SUPERCOPY_TRACE at a file. Each clipboard
+change is appended as one JSON line holding only its timestamp, size, token
+count, keyed hashes, a SimHash fingerprint and a MinHash sketch of its word
+shingles - never the text itself. The hashes (and the sketch) are keyed with a
+random salt kept in the trace's header line, so they can't be looked up in
+precomputed tables. Clips flagged as secrets are recorded with their size
+only.
+
+The simulator replays a trace in virtual time through a model of the
+Pipeline's scheduling (poll interval, debounce window, the one-slot queue in
+front of the analysis worker), the near-duplicate cache and a fake LLM with
+configurable latency, so policies can be compared offline:
+
+    python -m supercopy_core.trace_replay simulate trace.jsonl --poll 0.5 1 2 --debounce 0 0.5 --cache 64
+    python -m supercopy_core.trace_replay synth demo_trace.jsonl --events 500
+"""
+import argparse
+import bisect
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import random
+import secrets
+import statistics
+import threading
+import time
+from collections import OrderedDict
+
+from .clip_cache import canonicalize, is_structured, tokenize, shingle, simhash, hamming_distance
+
+TRACE_ENV = "SUPERCOPY_TRACE"
+# Values per MinHash sketch; Jaccard estimates are within about 0.06 near 0.85
+MINHASH_SIZE = 32
+
+
+# --- Recording ---
+class TraceRecorder:
+    """Appends content-free clipboard events to a JSON-lines trace file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._salt = None
+
+    def _load_salt(self):
+        """Reuses the salt of an existing trace, or starts the file with a new header."""
+        try:
+            with open(self.path, "r") as f:
+                header = json.loads(f.readline() or "{}")
+            if header.get("event") == "header" and header.get("salt"):
+                return bytes.fromhex(header["salt"])
+        except (OSError, ValueError):
+            pass
+        salt = secrets.token_bytes(16)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"event": "header", "version": 2, "salt": salt.hex()}) + "\n")
+        return salt
+
+    def _hash(self, value: str) -> str:
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def _minhash(self, shingles) -> str:
+        """A sketch whose matching positions estimate Jaccard similarity between clips."""
+        mins = [0xFFFFFFFF] * MINHASH_SIZE
+        for item in shingles:
+            data = item.encode("utf-8")
+            digest = b"".join(
+                hashlib.blake2b(data, key=self._salt, digest_size=64, person=f"minhash{n}".encode()).digest()
+                for n in range(MINHASH_SIZE // 16)
+            )
+            for n in range(MINHASH_SIZE):
+                mins[n] = min(mins[n], int.from_bytes(digest[4 * n:4 * n + 4], "big"))
+        return "".join(format(value, "08x") for value in mins)
+
+    def record_copy(self, text: str, secret: bool = False):
+        event = {"t": round(time.time(), 3), "event": "copy", "size": len(text), "secret": secret}
+        try:
+            with self._lock:
+                if self._salt is None:
+                    self._salt = self._load_salt()
+                # Secrets are short enough to brute-force from any hash, so they get none
+                if not secret:
+                    canonical = canonicalize(text)
+                    tokens = tokenize(canonical)
+                    shingles = shingle(tokens)
+                    # Like NearDuplicateCache, code and indented text only match exactly
+                    near = bool(tokens) and not is_structured(canonical)
+                    event.update({
+                        "tokens": len(tokens),
+                        "hash": self._hash(text),
+                        "canonical_hash": self._hash(canonical),
+                        "simhash": format(simhash(shingles), "016x") if near else None,
+                        "minhash": self._minhash(shingles) if near else None,
+                    })
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(event) + "\n")
+        except OSError as e:
+            print(f"Error writing trace: {e}")
+
+
+_recorder = None
+
+
+def get_recorder():
+    """Returns the process-wide TraceRecorder, or None when tracing is off."""
+    global _recorder
+    path = os.getenv(TRACE_ENV)
+    if not path:
+        return None
+    if _recorder is None or _recorder.path != path:
+        _recorder = TraceRecorder(os.path.expanduser(path))
+    return _recorder
+
+
+def load_trace(path: str):
+    with open(path, "r") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted((e for e in events if e.get("event") == "copy"), key=lambda e: e["t"])
+
+
+# --- Simulation ---
+def _jaccard_estimate(a: str, b: str) -> float:
+    """The fraction of MinHash sketch positions two events share."""
+    positions = range(0, min(len(a), len(b)), 8)
+    return sum(a[i:i + 8] == b[i:i + 8] for i in positions) / len(positions) if positions else 0.0
+
+
+class _TraceCache:
+    """
+    The NearDuplicateCache lookup rules, applied to hashes instead of text.
+    Near matches are verified with the MinHash estimate of Jaccard similarity;
+    events from older traces without a sketch only count as candidates.
+    """
+
+    def __init__(self, capacity: int, max_distance: int, min_tokens: int, similarity: float = 0.85):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self.similarity = similarity
+        self._entries = OrderedDict()  # canonical hash -> (fingerprint, sketch), or None
+        self.candidates = 0  # SimHash-close matches that could not be verified
+
+    def lookup(self, event) -> bool:
+        key = event["canonical_hash"]
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return True
+        if self.max_distance < 0 or event["tokens"] < self.min_tokens or not event["simhash"]:
+            return False
+        fingerprint = int(event["simhash"], 16)
+        sketch = event.get("minhash")
+        best_key, best_score, candidate = None, 0.0, False
+        for other_key, other in self._entries.items():
+            if other is None or hamming_distance(fingerprint, other[0]) > self.max_distance:
+                continue
+            if not sketch or not other[1]:
+                candidate = True
+                continue
+            score = _jaccard_estimate(sketch, other[1])
+            if score >= self.similarity and score > best_score:
+                best_key, best_score = other_key, score
+        if best_key is None:
+            self.candidates += candidate
+            return False
+        self._entries.move_to_end(best_key)
+        return True
+
+    def store(self, event):
+        if self.capacity <= 0:
+            return
+        tokens_ok = event["tokens"] >= self.min_tokens and event["simhash"]
+        features = (int(event["simhash"], 16), event.get("minhash")) if tokens_ok else None
+        self._entries[event["canonical_hash"]] = features
+        self._entries.move_to_end(event["canonical_hash"])
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+
+class FakeLatencyModel:
+    """LLM latency as a fixed base plus a per-1000-characters term, with optional seeded jitter."""
+
+    def __init__(self, base: float = 1.5, per_kchar: float = 0.2, jitter: float = 0.0, seed: int = 0):
+        self.base = base
+        self.per_kchar = per_kchar
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def latency(self, size: int) -> float:
+        value = self.base + self.per_kchar * size / 1000.0
+        if self.jitter:
+            value *= 1.0 + self._random.uniform(-self.jitter, self.jitter)
+        return value
+
+
+def simulate(events, poll: float = 1.0, debounce: float = 0.0, cache_size: int = 64,
+             max_distance: int = 6, min_tokens: int = 8, latency: FakeLatencyModel = None) -> dict:
+    """
+    Replays copy events through the Pipeline's scheduling in virtual time. The
+    monitor polls every `poll` seconds, waits until a new clip has been stable
+    for `debounce` seconds, then serves it from the cache or hands it to the
+    analysis worker through a one-slot queue. Like the Pipeline, polling goes
+    on while an analysis runs: a newer clip replaces one still waiting in the
+    slot, and the result for a clip that has since been replaced is cached but
+    never shown. Only final menus are modelled, not progressive ones.
+    """
+    latency = latency or FakeLatencyModel()
+    cache = _TraceCache(cache_size, max_distance, min_tokens)
+    if not events:
+        return {}
+    # Secret events carry no hash; the recorder only logs changes, so each is distinct
+    events = [event if "hash" in event else dict(event, hash=f"event:{n}") for n, event in enumerate(events)]
+    start, end = events[0]["t"], events[-1]["t"] + poll + debounce
+    times = [event["t"] for event in events]
+
+    index = -1
+    last_hash = None
+    pending, pending_since = None, 0.0
+    generation = 0
+    slot = None     # (event, generation) waiting for the worker
+    running = None  # (event, generation, finishes_at) on the worker
+    menu_event, menu_since = None, start
+    stale_time = 0.0
+    shown = set()
+    calls = hits = misses = secret_clips = dropped = wasted = 0
+    copy_to_menu = []
+
+    def show(event, at):
+        nonlocal menu_event, menu_since, stale_time
+        # Time the menu spent describing a clip that was no longer on the clipboard
+        stale_time += _stale_span(events, times, menu_event, menu_since, at)
+        menu_event, menu_since = event, at
+        shown.add(id(event))
+        copy_to_menu.append(at - event["t"])
+
+    def start_next(at):
+        nonlocal slot, running, calls, dropped
+        if running is not None or slot is None:
+            return
+        (event, clip_generation), slot = slot, None
+        if clip_generation != generation:
+            dropped += 1  # Superseded (by a cache hit or a secret) while it waited
+            return
+        calls += 1
+        running = (event, clip_generation, at + latency.latency(event["size"]))
+
+    def finish_until(now):
+        nonlocal running, wasted
+        while running is not None and running[2] <= now:
+            event, clip_generation, done = running
+            running = None
+            cache.store(event)
+            if clip_generation == generation:
+                show(event, done)
+            else:
+                wasted += 1
+            start_next(done)
+
+    now = start
+    while True:
+        finish_until(now)
+        while index + 1 < len(events) and events[index + 1]["t"] <= now:
+            index += 1
+        current = events[index] if index >= 0 else None
+        if current is not None and current["hash"] != last_hash:
+            if pending is None or pending["hash"] != current["hash"]:
+                pending, pending_since = current, now
+            if now - pending_since >= debounce:
+                last_hash = current["hash"]
+                pending = None
+                generation += 1
+                if current.get("secret"):
+                    secret_clips += 1
+                    show(current, now)
+                elif cache.lookup(current):
+                    hits += 1
+                    show(current, now)
+                else:
+                    misses += 1
+                    if slot is not None:
+                        dropped += 1
+                    slot = (current, generation)
+                    start_next(now)
+        if now >= end and last_hash == events[-1]["hash"] and running is None and slot is None:
+            break
+        now += poll
+    end = max(end, now)
+    stale_time += _stale_span(events, times, menu_event, menu_since, end)
+
+    ordered = sorted(copy_to_menu)
+    lookups = hits + misses
+    return {
+        "poll": poll,
+        "debounce": debounce,
+        "cache_size": cache_size,
+        "copies": len(events),
+        "analyzed": len(copy_to_menu),
+        "never_shown": len(events) - len(shown),
+        "llm_calls": calls,
+        "wasted_calls": wasted,
+        "dropped": dropped,
+        "cache_hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "near_candidates": cache.candidates,
+        "secrets_skipped": secret_clips,
+        "stale_fraction": round(stale_time / (end - start), 3) if end > start else 0.0,
+        "copy_to_menu_p50": round(statistics.median(ordered), 3) if ordered else 0.0,
+        "copy_to_menu_p95": round(ordered[math.ceil(len(ordered) * 0.95) - 1], 3) if ordered else 0.0,
+    }
+
+
+def _stale_span(events, times, menu_event, since: float, until: float) -> float:
+    """Seconds in [since, until) during which the clipboard held something other than menu_event."""
+    if until <= since:
+        return 0.0
+    menu_hash = menu_event["hash"] if menu_event else None
+    first = bisect.bisect_right(times, since)
+    holder = events[first - 1] if first > 0 else None
+    stale, held_from = 0.0, since
+    for event in events[first:bisect.bisect_left(times, until)]:
+        if holder is None or holder["hash"] != menu_hash:
+            stale += event["t"] - held_from
+        holder, held_from = event, event["t"]
+    if holder is None or holder["hash"] != menu_hash:
+        stale += until - held_from
+    return stale
+
+
+def synthesize(count: int, seed: int = 0):
+    """Generates a plausible content-free trace: bursts, re-copies and near-duplicates."""
+    rng = random.Random(seed)
+    events, t = [], 1_700_000_000.0
+    recent = []
+    for n in range(count):
+        t += rng.choice([0.2, 0.4, 1.5, 3.0, 8.0, 30.0, 120.0])
+        roll = rng.random()
+        if recent and roll < 0.2:
+            event = dict(rng.choice(recent))
+        elif recent and roll < 0.3:
+            event = dict(rng.choice(recent))
+            if not event["secret"]:
+                event["hash"] = format(rng.getrandbits(64), "016x")
+            if event.get("simhash"):
+                event["simhash"] = format(int(event["simhash"], 16) ^ (1 << rng.randrange(64)), "016x")
+                event["canonical_hash"] = format(rng.getrandbits(64), "016x")
+                # An edit changes a few sketch positions; larger edits fall below the similarity bar
+                values = [event["minhash"][i:i + 8] for i in range(0, len(event["minhash"]), 8)]
+                for position in rng.sample(range(MINHASH_SIZE), rng.randint(1, 8)):
+                    values[position] = format(rng.getrandbits(32), "08x")
+                event["minhash"] = "".join(values)
+        else:
+            size = int(rng.lognormvariate(5.0, 1.3))
+            tokens = max(1, size // 6)
+            event = {
+                "event": "copy",
+                "size": size,
+                "tokens": tokens,
+                "hash": format(rng.getrandbits(64), "016x"),
+                "canonical_hash": format(rng.getrandbits(64), "016x"),
+                "simhash": format(rng.getrandbits(64), "016x"),
+                "minhash": "".join(format(rng.getrandbits(32), "08x") for _ in range(MINHASH_SIZE)),
+                "secret": tokens == 1 and size < 30,
+            }
+            if event["secret"]:
+                event = {"event": "copy", "size": size, "secret": True}
+        event["t"] = round(t, 3)
+        events.append(event)
+        recent = (recent + [event])[-20:]
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SuperCopy trace replay simulator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sim = sub.add_parser("simulate", help="Replay a trace under one or more policies")
+    sim.add_argument("trace")
+    sim.add_argument("--poll", type=float, nargs="+", default=[1.0])
+    sim.add_argument("--debounce", type=float, nargs="+", default=[0.0])
+    sim.add_argument("--cache", type=int, nargs="+", default=[64])
+    sim.add_argument("--latency", type=float, default=1.5, help="Fake LLM base latency in seconds")
+    sim.add_argument("--per-kchar", type=float, default=0.2, help="Extra fake latency per 1000 characters")
+    sim.add_argument("--jitter", type=float, default=0.0)
+    sim.add_argument("--seed", type=int, default=0)
+    synth = sub.add_parser("synth", help="Write a synthetic trace")
+    synth.add_argument("output")
+    synth.add_argument("--events", type=int, default=500)
+    synth.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "synth":
+        with open(args.output, "w") as f:
+            for event in synthesize(args.events, args.seed):
+                f.write(json.dumps(event) + "\n")
+        print(f"Wrote {args.events} events to {args.output}")
+        return
+
+    events = load_trace(args.trace)
+    columns = ["poll", "debounce", "cache_size", "llm_calls", "wasted_calls", "cache_hit_rate", "never_shown",
+               "stale_fraction", "copy_to_menu_p50", "copy_to_menu_p95"]
+    print("  ".join(f"{c:>16}" for c in columns))
+    for poll, debounce, cache_size in itertools.product(args.poll, args.debounce, args.cache):
+        model = FakeLatencyModel(args.latency, args.per_kchar, args.jitter, args.seed)
+        report = simulate(events, poll, debounce, cache_size, latency=model)
+        print("  ".join(f"{report[c]:>16}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,31 @@
 import json
-from llm_service import GeminiService
+import os
+import sys
 
-def extract_features(text: str, llm_service: GeminiService) -> dict:
-    """Extracts features from text using the provided LLM service."""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from supercopy_core.llm_service import GeminiService
+
+def extract_features(text: str, llm_service: GeminiService, on_update=None) -> dict:
+    """
+    Extracts features from text using the provided LLM service. If on_update is
+    given it is called with partial results, as on_update(data, done).
+    """
+    if on_update:
+        return llm_service.analyze_progressive(text, on_update)
     return llm_service.analyze_text(text)
 
 if __name__ == "__main__":
     # This block is for demonstrating the llm_handler.py as a standalone script.
-    api_key = input("Please enter your Gemini API Key: ")
-    if not api_key:
+    # A running engine daemon (python -m supercopy_core.engine_daemon serve) is used when available.
+    from supercopy_core.engine_daemon import connect_engine
+    engine_service = connect_engine()
+    api_key = "" if engine_service else input("Please enter your Gemini API Key: ")
+    if not api_key and not engine_service:
         print("API key is required to run this demonstration.")
     else:
         try:
-            gemini_service = GeminiService(api_key)
+            gemini_service = engine_service or GeminiService(api_key)
             sample_text = "John Doe, a software engineer, can be reached at john.doe@email.com or 555-123-4567. His colleague, Jane Smith (jane.s@workplace.net), is also on the project. The project kickoff is tomorrow."
             print(f"Analyzing text: \"{sample_text}\"")
             extracted_data = extract_features(sample_text, gemini_service)
@@ -1,4 +1,3 @@
-
 import time
 import pyperclip
 from PIL import Image, ImageDraw
@@ -6,36 +5,28 @@ from pystray import Icon as icon, Menu as menu, MenuItem as item
 import threading
 import json
 import os
+import sys
 import tkinter as tk
 from tkinter import simpledialog, messagebox
 from functools import partial
-from llm_handler import extract_features
-from llm_service import GeminiService
 import multiprocessing
 from settings_app import settings_dialog_process
 
+# The shared engine lives next to this folder (bundled by supercopy.spec)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from supercopy_core.menu_model import build_menu_model
+from supercopy_core.pipeline import Pipeline, create_llm_service
+from supercopy_core.profiling import profiled, profile_section, start_from_env, toggle_profiling, is_profiling, debug_menu_enabled
+
 # --- Global State ---
 CONFIG_FILE = os.path.expanduser("~/.supercopy_config.json")
-extracted_data = {}
-last_text = ""
-llm_service = None
+menu_model = build_menu_model({})
+pipeline = None
 is_paused = False
 api_key = None
 tray_icon = None
 
-# --- Secret Detection ---
-def detect_secrets(text):
-    """Detect if text contains sensitive information like passwords"""
-    # Simple rule: if it's a single string with no spaces and under 30 characters,
-    # it's likely a password or sensitive token
-    text = text.strip()
-
-    # Check if it's a single string with no spaces and under 30 characters
-    if len(text) < 30 and ' ' not in text and len(text) > 0:
-        return True
-
-    return False
-
 # --- Config Management ---
 def load_config():
     global api_key
@@ -88,9 +79,40 @@ except:
     processing_icon = create_fallback_icon('blue')
     paused_icon = create_fallback_icon('gray')
 
+# --- Pipeline ---
+def init_pipeline():
+    global pipeline
+    service = create_llm_service(api_key)
+    if pipeline is not None:
+        pipeline.set_service(service)  # Keeps the cache across settings changes
+        return
+    pipeline = Pipeline(
+        service,
+        read_clipboard=pyperclip.paste,
+        write_clipboard=pyperclip.copy,
+        on_menu=on_menu_model,
+        on_status=on_pipeline_status,
+    )
+
+def on_menu_model(model, done):
+    global menu_model
+    menu_model = model
+    if tray_icon:
+        update_tray_menu(tray_icon)
+
+def on_pipeline_status(status):
+    if not tray_icon or is_paused:
+        return
+    if status == "processing":
+        tray_icon.icon = processing_icon
+        tray_icon.title = "SuperCopy (Processing...)"
+    else:
+        tray_icon.icon = default_icon
+        tray_icon.title = "SuperCopy"
+
 # --- Settings Dialog ---
 def show_settings_dialog():
-    global api_key, llm_service
+    global api_key
     queue = multiprocessing.Queue()
     p = multiprocessing.Process(target=settings_dialog_process, args=(api_key, queue))
     p.start()
@@ -100,7 +122,7 @@ def show_settings_dialog():
         api_key = result
         save_config()
         try:
-            llm_service = GeminiService(api_key)
+            init_pipeline()
         except Exception as e:
             # Optionally show a notification or log error
             pass
@@ -125,12 +147,26 @@ def on_settings(tray_icon, item):
     show_settings_dialog()
     update_tray_menu(tray_icon)
 
-def copy_to_clipboard(value, *args, **kwargs):
-    pyperclip.copy(value)
+def copy_to_clipboard(value, parent="", *args, **kwargs):
+    if pipeline:
+        pipeline.copy(value, parent)  # Not re-analyzed on the next poll
+    else:
+        pyperclip.copy(value)
     # Optionally, show a notification (Windows toast notification can be added)
 
+def on_toggle_profiling(tray_icon, item):
+    toggle_profiling()
+    update_tray_menu(tray_icon)
+
+def add_profiling_item(menu_items, tray_icon):
+    # Hidden unless SUPERCOPY_DEBUG_MENU is set or profiling is running
+    if debug_menu_enabled():
+        title = "Stop Profiling" if is_profiling() else "Start Profiling"
+        menu_items.append(item(title, lambda icon, item: on_toggle_profiling(tray_icon, item)))
+
+@profiled
 def update_tray_menu(tray_icon):
-    global extracted_data, is_paused, last_text
+    global menu_model, is_paused
     menu_items = []
     pause_text = "Resume Monitoring" if is_paused else "Pause Monitoring"
     menu_items.append(item(pause_text, lambda icon, item: on_pause_resume(tray_icon, item)))
@@ -138,76 +174,44 @@ def update_tray_menu(tray_icon):
     if not api_key:
         menu_items.append(item("Error: Please configure API key in Settings", lambda: None, enabled=False))
         menu_items.append(menu.SEPARATOR)
+        add_profiling_item(menu_items, tray_icon)
         menu_items.append(item("Settings", lambda icon, item: on_settings(tray_icon, item)))
         menu_items.append(item('Exit', lambda icon, item: on_exit(tray_icon, item)))
         tray_icon.menu = menu(*menu_items)
         return
-    if not extracted_data:
+    if menu_model.kind == "empty":
         menu_items.append(item('Copy some text to start', lambda: None, enabled=False))
-    elif "error" in extracted_data:
-        menu_items.append(item(f"Error: {extracted_data['error']}", lambda: None, enabled=False))
-    elif "warning" in extracted_data:
-        menu_items.append(item(extracted_data["warning"], lambda: None, enabled=False))
+    elif menu_model.kind == "error":
+        menu_items.append(item(f"Error: {menu_model.message}", lambda: None, enabled=False))
+    elif menu_model.kind == "warning":
+        menu_items.append(item(menu_model.message, lambda: None, enabled=False))
         menu_items.append(menu.SEPARATOR)
-        if last_text:
-            menu_items.append(item(f"Original: {last_text[:30]}...", partial(copy_to_clipboard, last_text)))
-    elif "info" in extracted_data:
-        menu_items.append(item(extracted_data["info"], lambda: None, enabled=False))
+        if menu_model.original:
+            menu_items.append(item(menu_model.original_label, partial(copy_to_clipboard, menu_model.original, menu_model.original)))
+    elif menu_model.kind == "info":
+        menu_items.append(item(menu_model.message, lambda: None, enabled=False))
     else:
-        for key, value in extracted_data.items():
-            if key == "error" or not value:
-                continue
-            if isinstance(value, list) and len(value) > 0:
-                all_items = ", ".join(str(item) for item in value)
-                preview = all_items[:30] + "..." if len(all_items) > 30 else all_items
-                label = f"Paste All {key.replace('_', ' ').title()} ({len(value)}): {preview}"
-                menu_items.append(item(label, partial(copy_to_clipboard, all_items)))
-            elif isinstance(value, str):
-                preview = value[:30] + "..." if len(value) > 30 else value
-                label = f"Paste {key.replace('_', ' ').title()}: {preview}"
-                menu_items.append(item(label, partial(copy_to_clipboard, value)))
-            else:
-                value_str = str(value)
-                preview = value_str[:30] + "..." if len(value_str) > 30 else value_str
-                label = f"Paste {key.replace('_', ' ').title()}: {preview}"
-                menu_items.append(item(label, partial(copy_to_clipboard, value_str)))
+        for entry in menu_model.entries:
+            menu_items.append(item(entry.label, partial(copy_to_clipboard, entry.value, menu_model.original)))
         menu_items.append(menu.SEPARATOR)
-        if last_text:
-            menu_items.append(item(f"Original: {last_text[:30]}...", partial(copy_to_clipboard, last_text)))
+        if menu_model.original:
+            menu_items.append(item(menu_model.original_label, partial(copy_to_clipboard, menu_model.original, menu_model.original)))
     menu_items.append(menu.SEPARATOR)
+    add_profiling_item(menu_items, tray_icon)
     menu_items.append(item("Settings", lambda icon, item: on_settings(tray_icon, item)))
     menu_items.append(item('Exit', lambda icon, item: on_exit(tray_icon, item)))
     tray_icon.menu = menu(*menu_items)
 
 # --- Background Task ---
 def clipboard_monitor(tray_icon):
-    global last_text, extracted_data, llm_service, is_paused
     while True:
-        if is_paused or not llm_service:
+        if is_paused or not pipeline:
             time.sleep(1)
             continue
         try:
-            text = pyperclip.paste()
-            if text and text != last_text:
-                last_text = text
-                tray_icon.icon = processing_icon
-                tray_icon.title = "SuperCopy (Processing...)"
-                try:
-                    # Check for secrets before sending to LLM
-                    if detect_secrets(text):
-                        extracted_data = {"warning": "Secrets detected: Skipping analysis"}
-                        update_tray_menu(tray_icon)
-                    else:
-                        new_data = extract_features(text, llm_service)
-                        if new_data != extracted_data:
-                            extracted_data = new_data
-                            update_tray_menu(tray_icon)
-                except Exception as e:
-                    extracted_data = {"error": str(e)}
-                    update_tray_menu(tray_icon)
-                finally:
-                    tray_icon.icon = default_icon
-                    tray_icon.title = "SuperCopy"
+            # Analysis runs on the pipeline's own worker, so polling never blocks on the LLM
+            with profile_section("clipboard_monitor"):
+                pipeline.poll()
         except pyperclip.PyperclipException:
             pass
         time.sleep(1)
@@ -217,10 +221,12 @@ if __name__ == "__main__":
     multiprocessing.freeze_support()
     multiprocessing.set_start_method('spawn', force=True)
     load_config()
+    start_from_env()  # SUPERCOPY_PROFILE=1
     try:
-        llm_service = GeminiService(api_key) if api_key else None
+        if api_key:
+            init_pipeline()
     except Exception as e:
-        llm_service = None
+        pipeline = None
     initial_menu = menu(
         item('Copy some text to start', lambda: None, enabled=False),
         menu.SEPARATOR,
@@ -1,9 +1,10 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
 
 a = Analysis(
     ['main.py'],
-    pathex=[],
+    pathex=[os.path.join(SPECPATH, '..')],  # Shared supercopy_core package
     binaries=[],
     datas=[('settings_app.py', '.')],
     hiddenimports=[],